@@ -12,5 +12,9 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ecomm.settings')
+# every ASGI request runs its sync and ORM code on a thread of its own, so a
+# persistent connection is never reused and lingers until that thread is gone;
+# close per request instead (see ecomm/database.py)
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
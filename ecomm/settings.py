@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 
 import os
 from pathlib import Path
+from .database import cache_config, database_config, replica_configs
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -48,6 +49,10 @@ INSTALLED_APPS = [
 ]
 CRISPY_TEMPLATE_PACK = 'bootstrap5'
 MIDDLEWARE = [
+    # first, so its latency covers the rest of the stack
+    'shop.instrumentation.RequestMetricsMiddleware',
+    # before the others, so every write of the request can pin its visitor
+    'shop.replicas.ReplicaPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -64,7 +69,8 @@ ROOT_URLCONF = 'ecomm.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates that reports render time to the request metrics
+        'BACKEND': 'shop.instrumentation.InstrumentedDjangoTemplates',
         'DIRS': ['templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -97,12 +103,17 @@ WSGI_APPLICATION = 'ecomm.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# SQLite in WAL mode with persistent connections, or PostgreSQL with a pool
+# through DATABASE_URL; see ecomm/database.py for the variables
+DATABASE_REPLICAS = replica_configs(os.environ, BASE_DIR)
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': database_config(os.environ, BASE_DIR),
+    **DATABASE_REPLICAS,
 }
+# catalogue and profile reads go to a replica, writes and everything else to default
+DATABASE_ROUTERS = ['shop.replicas.PrimaryReplicaRouter']
+# after a write, the visitor reads from the primary for this long (longer than replica lag)
+REPLICA_PIN_SECONDS = 10
 
 
 # Password validation
@@ -143,6 +154,8 @@ STATIC_URL = 'static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR,'shop', 'media')
+# widths of the resized product images, see shop/images.py
+PRODUCT_IMAGE_WIDTHS = (320, 640, 960)
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
@@ -162,6 +175,17 @@ SSLCOMMERZ_STORE_PASSWORD = "eshop6939f324a51e1@ssl"
 SSLCOMMERZ_PAYMENT_URL = "https://sandbox.sslcommerz.com/gwprocess/v3/api.php"
 SSLCOMMERZ_VALIDATION_URL = "https://sandbox.sslcommerz.com/validator/api/validationserverAPI.php"
 SSLCOMMERZ_VALIDATION_URL = 'https://sandbox.sslcommerz.com/validator/api/validationserverAPI.php?wsdl'
+# gateway client, see shop/gateway.py: timeouts in seconds, retries with backoff,
+# circuit opens after BREAKER_THRESHOLD failures for BREAKER_RESET seconds
+SSLCOMMERZ_CONNECT_TIMEOUT = 3.05
+SSLCOMMERZ_READ_TIMEOUT = 10
+SSLCOMMERZ_RETRIES = 2
+SSLCOMMERZ_BACKOFF = 0.3
+SSLCOMMERZ_POOL_SIZE = 10
+SSLCOMMERZ_BREAKER_THRESHOLD = 5
+SSLCOMMERZ_BREAKER_RESET = 30
+# unpaid orders give their reserved stock back after this, see release_expired_reservations
+STOCK_RESERVATION_MINUTES = 30
 
 
 #Email setup
@@ -176,5 +200,32 @@ EMAIL_HOST_PASSWORD = 'fisitchjwuzwrkoo'    # real password নয়!
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        # checkout timings and other shop instrumentation
+        'shop': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
 
 
+
+# catalogue pages and fragments, see shop/caching.py, and the cart badge of each
+# user, see shop/cart.py; set CACHE_URL to a shared backend (Redis/Memcached) when
+# running several workers, so every one sees the same version and the same invalidations
+CACHES = {
+    'default': cache_config(os.environ),
+}
+CATALOGUE_CACHE_TIMEOUT = 300
+CART_SUMMARY_TIMEOUT = 300
+INTERNAL_IPS = ['127.0.0.1']
+
+# per-view query count, DB/template time and latency, see shop/instrumentation.py;
+# scraped from /metrics/ like the cache counters
+REQUEST_METRICS_SAMPLE_RATE = 1.0
+REQUEST_METRICS_SERVER_TIMING = True
+REQUEST_METRICS_DUPLICATE_WARNING = 5  # log requests repeating this many statements
@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import Category,Product,Rating,Cart,CartItem,Order,OrderItem
+from django.utils import timezone
+from . import exports
+from .models import Category,Product,Rating,Cart,CartItem,Order,OrderItem,OutboxEmail
 # Register your models here.
 # admin.site.register(Category)
 
@@ -22,6 +24,20 @@ class ProductAdmin(admin.ModelAdmin):
     prepopulated_fields = {'slug': ('name',)}
     list_editable = ['price','stock','available']
     inlines = [RatingInline]
+    actions = ['export_sales_csv','export_sales_jsonl']
+
+    def _export_sales(self, request, queryset, fmt):
+        # paid order lines of the selected products
+        items = OrderItem.objects.filter(product__in=queryset.values('pk'), order__paid=True)
+        return exports.streaming_export(request, items, fmt, 'sales')
+
+    @admin.action(description='Export sales of selected products (CSV)')
+    def export_sales_csv(self, request, queryset):
+        return self._export_sales(request, queryset, 'csv')
+
+    @admin.action(description='Export sales of selected products (JSONL)')
+    def export_sales_jsonl(self, request, queryset):
+        return self._export_sales(request, queryset, 'jsonl')
 
 class CartItemInline(admin.TabularInline):
     model = CartItem
@@ -42,7 +58,25 @@ class OrderAdmin(admin.ModelAdmin):
     list_display = ['id','user','first_name','last_name','email','paid','created','status']
     list_filter = ['paid','created','status']
     search_fields = ['first_name','last_name','email']
+    readonly_fields = ['subtotal','item_count']
     inlines = [OrderItemInline]
+    actions = ['export_csv','export_jsonl']
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        form.instance.update_totals()
+
+    def _export(self, request, queryset, fmt):
+        items = OrderItem.objects.filter(order__in=queryset.values('pk'))
+        return exports.streaming_export(request, items, fmt, 'orders')
+
+    @admin.action(description='Export selected orders with their lines (CSV)')
+    def export_csv(self, request, queryset):
+        return self._export(request, queryset, 'csv')
+
+    @admin.action(description='Export selected orders with their lines (JSONL)')
+    def export_jsonl(self, request, queryset):
+        return self._export(request, queryset, 'jsonl')
 
 
 @admin.register(Rating)
@@ -50,3 +84,15 @@ class RatingAdmin(admin.ModelAdmin):
     list_display = ['user','product','rating','created']
     search_fields = ['user','product','rating']
 
+
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ['id','kind','order','status','attempts','available_at','sent_at']
+    list_filter = ['status','kind']
+    readonly_fields = ['last_error','created','sent_at']
+    actions = ['requeue']
+
+    @admin.action(description='Send again')
+    def requeue(self, request, queryset):
+        updated = queryset.exclude(status='sent').update(status='pending', attempts=0, available_at=timezone.now(), locked_until=None)
+        self.message_user(request, f'{updated} emails queued again')
@@ -0,0 +1,161 @@
+import hashlib
+from django.core.files.storage import default_storage
+from django.db.models import Count, F, Max, Q
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_safe
+from .facets import ProductFilters
+from .models import Category, Product, Rating
+from .pagination import InvalidCursor, KeysetPaginator, cursor_url
+from .replicas import replica_reads
+from .search import search_products
+
+API_PAGE_SIZE = 50
+# read straight into dicts with .values(), no model instances on the way out
+PRODUCT_FIELDS = (
+    'id', 'name', 'slug', 'description', 'price', 'stock', 'image',
+    'rating_avg', 'rating_count', 'created', 'updated',
+)
+RATING_ORDERING = ('-created', '-id')
+
+
+def _etag(*parts):
+    return quote_etag(hashlib.sha1('|'.join(str(p) for p in parts).encode()).hexdigest())
+
+
+def _conditional(request, etag, last_modified, build):
+    """A 304 when the client's copy is current, else ``build()`` as JSON.
+
+    The validators come from one cheap query, so a revalidation skips the
+    page query and the serialization.
+    """
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = JsonResponse(build())
+    response['ETag'] = etag
+    if timestamp is not None:
+        response['Last-Modified'] = http_date(timestamp)
+    # edge caches may keep it but must ask again before reuse
+    patch_cache_control(response, public=True, max_age=0, must_revalidate=True)
+    return response
+
+
+def _error(message, status=400):
+    return JsonResponse({'error': message}, status=status)
+
+
+def _product(row):
+    return {
+        'id': row['id'],
+        'name': row['name'],
+        'slug': row['slug'],
+        'category': row['category_slug'],
+        'description': row['description'],
+        'price': row['price'],
+        'stock': row['stock'],
+        'image': default_storage.url(row['image']) if row['image'] else None,
+        'rating': {'average': row['rating_avg'], 'count': row['rating_count']},
+        'created': row['created'],
+        'updated': row['updated'],
+    }
+
+
+def _page_links(request, page):
+    def link(cursor):
+        url = cursor_url(request, cursor)
+        return request.build_absolute_uri(url) if url else None
+    return {'next': link(page.next_cursor), 'previous': link(page.previous_cursor)}
+
+
+@replica_reads
+@require_safe
+def products(request):
+    """Available products, with the filters, search and sorts of product_list."""
+    filters = ProductFilters(request.GET)
+    products = Product.objects.available()
+    if filters.search:
+        products = search_products(products, filters.search)
+    if request.GET.get('category'):
+        products = products.filter(category__slug=request.GET['category'])
+    products = products.filter(filters.q())
+
+    ordering = filters.ordering()
+    fields = [f.lstrip('-') for f in ordering if f.lstrip('-') not in PRODUCT_FIELDS]
+    paginator = KeysetPaginator(
+        products.values(*PRODUCT_FIELDS, *fields, category_slug=F('category__slug')), ordering, per_page=API_PAGE_SIZE
+    )
+    cursor = request.GET.get('cursor')
+    try:
+        if cursor:
+            paginator.decode(cursor)
+    except InvalidCursor:
+        return _error('invalid cursor')
+
+    # any edit, (un)listing or deletion in the filtered set moves the newest
+    # updated or the count; rating and stock changes touch updated too
+    state = products.order_by().aggregate(last_modified=Max('updated'), count=Count('id'))
+    params = sorted((k, v) for k, values in request.GET.lists() for v in values if v)
+    etag = _etag('products', state['last_modified'], state['count'], params)
+
+    def build():
+        page = paginator.page(cursor)
+        return {'count': state['count'], **_page_links(request, page), 'results': [_product(row) for row in page]}
+    return _conditional(request, etag, state['last_modified'], build)
+
+
+@replica_reads
+@require_safe
+def product(request, slug):
+    row = (
+        Product.objects.available().filter(slug=slug)
+        .values(*PRODUCT_FIELDS, category_slug=F('category__slug')).first()
+    )
+    if row is None:
+        return _error('not found', status=404)
+    return _conditional(request, _etag('product', row['id'], row['updated']), row['updated'], lambda: _product(row))
+
+
+@replica_reads
+@require_safe
+def product_ratings(request, slug):
+    product = Product.objects.available().filter(slug=slug).only('id').first()
+    if product is None:
+        return _error('not found', status=404)
+    ratings = Rating.objects.filter(product=product)
+    paginator = KeysetPaginator(
+        ratings.values('id', 'rating', 'comment', 'created', 'updated', username=F('user__username')),
+        RATING_ORDERING, per_page=API_PAGE_SIZE,
+    )
+    cursor = request.GET.get('cursor')
+    try:
+        if cursor:
+            paginator.decode(cursor)
+    except InvalidCursor:
+        return _error('invalid cursor')
+
+    state = ratings.order_by().aggregate(last_modified=Max('updated'), count=Count('id'))
+    etag = _etag('ratings', product.id, state['last_modified'], state['count'], cursor)
+
+    def build():
+        page = paginator.page(cursor)
+        results = [
+            {'id': row['id'], 'user': row['username'], 'rating': row['rating'], 'comment': row['comment'],
+             'created': row['created'], 'updated': row['updated']}
+            for row in page
+        ]
+        return {'count': state['count'], **_page_links(request, page), 'results': results}
+    return _conditional(request, etag, state['last_modified'], build)
+
+
+@replica_reads
+@require_safe
+def categories(request):
+    rows = list(
+        Category.objects.order_by('name')
+        .values('id', 'name', 'slug', 'description')
+        .annotate(product_count=Count('products', filter=Q(products__available=True)))
+    )
+    # categories carry no timestamp, the body is small enough to hash
+    return _conditional(request, _etag('categories', rows), None, lambda: {'results': rows})
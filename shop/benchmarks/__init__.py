@@ -0,0 +1,4 @@
+"""Storefront benchmarks: seeded synthetic data, scripted flows and a load driver.
+
+Run them with ``python manage.py run_benchmarks``; see shop/benchmarks/runner.py.
+"""
@@ -0,0 +1,180 @@
+import asyncio
+import json
+import random
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from time import perf_counter, sleep
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+from shop.models import Order
+from .data import Catalogue
+from .flows import FlowError
+from .runner import percentile
+
+VIEWS = ('home', 'product_list', 'product_detail', 'cart_detail', 'payment_process')
+GATEWAY_PAGE = 'https://sandbox.sslcommerz.com/EasyCheckOut/bench'
+
+
+class SlowGateway(ThreadingHTTPServer):
+    """Accepts every SSLCommerz payment init after ``delay`` seconds, like a slow sandbox."""
+
+    daemon_threads = True
+    request_queue_size = 256  # every visitor may connect at once
+
+    def __init__(self, delay):
+        self.delay = delay
+        super().__init__(('127.0.0.1', 0), SlowGatewayHandler)
+        Thread(target=self.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}/gwprocess/v3/api.php'
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+
+class SlowGatewayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        sleep(self.server.delay)
+        payload = json.dumps({'status': 'SUCCESS', 'GatewayPageURL': GATEWAY_PAGE}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def plan(catalogue, views, count, seed=1):
+    """``count`` (view, path, expected status) picks, the same list for both workers."""
+    rng = random.Random(seed)
+    paths = {
+        'home': lambda: reverse('shop:home'),
+        'product_list': lambda: reverse('shop:product_list'),
+        'product_detail': lambda: reverse('shop:product_detail', args=[rng.choice(catalogue.products)[1]]),
+        'cart_detail': lambda: reverse('shop:cart_detail'),
+        'payment_process': lambda: reverse('shop:payment_process'),
+    }
+    picks = []
+    for view in rng.choices(views, k=count):
+        picks.append((view, paths[view](), 302 if view == 'payment_process' else 200))
+    return picks
+
+
+def login_cookie(username):
+    """A logged-in session with a pending order, so payment_process calls the gateway.
+
+    Logged-in pages skip the page cache, every request does its real work.
+    """
+    user = User.objects.get(username=username)
+    order = Order.objects.create(
+        user=user, first_name='Bench', last_name='Async', email='bench@example.com',
+        address='Road 1', postal_code='1200', city='Dhaka', note='benchmark',
+    )
+    client = Client()
+    client.force_login(user)
+    session = client.session
+    session['order_id'] = order.id
+    session.save()
+    return client.cookies[settings.SESSION_COOKIE_NAME].value
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self.in_flight = self.peak = 0
+        self.errors = 0
+        self.first_error = None
+
+    def start(self):
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        return perf_counter()
+
+    def finish(self, view, started, status, expected):
+        self.in_flight -= 1
+        self.samples.setdefault(view, []).append((perf_counter() - started) * 1000)
+        if status != expected:
+            self.errors += 1
+            self.first_error = self.first_error or f'{view}: expected {expected}, got {status}'
+
+    def summary(self, wall):
+        ordered = sorted(ms for values in self.samples.values() for ms in values)
+        return {
+            'requests': len(ordered),
+            'errors': self.errors,
+            'first_error': self.first_error,
+            'peak_in_flight': self.peak,
+            'wall_seconds': round(wall, 3),
+            'throughput': round(len(ordered) / wall, 2) if wall else None,
+            **{f'p{p}_ms': round(percentile(ordered, p), 3) if ordered else None for p in (50, 95, 99)},
+        }
+
+
+def run_sync(picks, cookie):
+    """A sync worker: the WSGI handler, one request at a time, waiting out every gateway call."""
+    client = Client()
+    client.cookies[settings.SESSION_COOKIE_NAME] = cookie
+    recorder = Recorder()
+    started = perf_counter()
+    for view, path, expected in picks:
+        start = recorder.start()
+        status = client.get(path).status_code
+        recorder.finish(view, start, status, expected)
+    return recorder.summary(perf_counter() - started)
+
+
+async def _run_async(picks, cookie, concurrency):
+    client = AsyncClient()
+    client.cookies[settings.SESSION_COOKIE_NAME] = cookie
+    recorder = Recorder()
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(view, path, expected):
+        async with slots:
+            start = recorder.start()
+            status = (await client.get(path)).status_code
+            recorder.finish(view, start, status, expected)
+
+    started = perf_counter()
+    await asyncio.gather(*(one(*pick) for pick in picks))
+    return recorder.summary(perf_counter() - started)
+
+
+def run_async(picks, cookie, concurrency):
+    """An async worker: the ASGI handler on one event loop, up to ``concurrency`` requests at once.
+
+    Run through async_to_sync, so the ORM and template work of every request
+    shares this one thread, as much sync capacity as ``run_sync`` gets.
+    """
+    return async_to_sync(_run_async)(picks, cookie, concurrency)
+
+
+def compare_workers(views=VIEWS, count=200, concurrency=50, delay=0.1, seed=1):
+    """The same ``count`` requests through one sync worker and one async worker.
+
+    Returns ``{'sync': summary, 'async': summary}``; the gateway answers
+    after ``delay`` seconds, which only the async worker can overlap.
+    """
+    catalogue = Catalogue.load()
+    if not catalogue.usernames or not catalogue.products:
+        raise FlowError('no bench-* users or products, seed the database first')
+    picks = plan(catalogue, list(views), count, seed)
+    cookie = login_cookie(catalogue.usernames[0])
+    gateway = SlowGateway(delay)
+    try:
+        # both clients send Host: testserver, as Django's test runner allows it
+        with override_settings(SSLCOMMERZ_PAYMENT_URL=gateway.url, ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            return {'sync': run_sync(picks, cookie), 'async': run_async(picks, cookie, concurrency)}
+    finally:
+        gateway.close()
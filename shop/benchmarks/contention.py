@@ -0,0 +1,100 @@
+import os
+import random
+import threading
+from time import perf_counter
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import OperationalError, connection, connections, transaction
+from ecomm.database import sqlite_config
+from shop import cart as carts
+from shop.models import Product
+from .data import USERNAME
+from .runner import percentile
+
+
+def profiles(path):
+    """The database entries compared: SQLite as configured before, and ecomm.database's tuning."""
+    return {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3', 'NAME': str(path),
+            'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False, 'OPTIONS': {}, 'PRAGMAS': None,
+        },
+        'tuned': {**sqlite_config(str(path), os.environ), 'CONN_MAX_AGE': 0},
+    }
+
+
+def use_profile(entry):
+    """Point the default database at ``entry`` for connections opened from now on, in every thread."""
+    connections.close_all()
+    # connections read this dict (and its Django defaults) when a thread opens one, update it in place
+    settings.DATABASES['default'].update(entry)
+    connections['default'].settings_dict.update(entry)
+
+
+def read(rng, slugs):
+    # a listing page and a product page, what most visitors do
+    list(Product.objects.for_listing().order_by('-created')[:24])
+    Product.objects.for_detail().get(slug=rng.choice(slugs))
+
+
+def write(rng, product_ids, user):
+    # cart_add: get_or_create then an F() update, in one transaction like checkout's writes
+    with transaction.atomic():
+        carts.add(carts.get_cart(user), rng.choice(product_ids))
+
+
+def worker(role, deadline, seed, results, user=None):
+    rng = random.Random(seed)
+    slugs = list(Product.objects.available().values_list('slug', flat=True)[:500])
+    product_ids = list(Product.objects.values_list('id', flat=True)[:500])
+    samples, errors = [], 0
+    try:
+        while perf_counter() < deadline:
+            start = perf_counter()
+            try:
+                if role == 'read':
+                    read(rng, slugs)
+                else:
+                    write(rng, product_ids, user)
+            except OperationalError:
+                # "database is locked": the request would have been a 500
+                errors += 1
+            else:
+                samples.append((perf_counter() - start) * 1000)
+    finally:
+        connection.close()
+    results.append((role, samples, errors))
+
+
+def run(readers=8, writers=4, seconds=5.0, seed=1):
+    """``readers`` and ``writers`` threads hammering the current database for ``seconds``.
+
+    Returns ``{'read': summary, 'write': summary}`` with throughput, failed
+    operations and latency percentiles.
+    """
+    users = list(User.objects.filter(username__startswith=USERNAME.format('')).order_by('id')[:writers])
+    if len(users) < writers:
+        raise ValueError(f'{writers} writers need {writers} bench users, the database has {len(users)}')
+    results = []
+    deadline = perf_counter() + seconds
+    threads = [threading.Thread(target=worker, args=('read', deadline, seed + i, results)) for i in range(readers)]
+    threads += [
+        threading.Thread(target=worker, args=('write', deadline, seed + readers + i, results, user))
+        for i, user in enumerate(users)
+    ]
+    started = perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = perf_counter() - started
+    summary = {}
+    for role in ('read', 'write'):
+        samples = sorted(ms for r, values, _ in results if r == role for ms in values)
+        summary[role] = {
+            'ops': len(samples),
+            'errors': sum(e for r, _, e in results if r == role),
+            'throughput': round(len(samples) / wall, 1),
+            **{f'p{p}_ms': round(percentile(samples, p), 2) if samples else None for p in (50, 95, 99)},
+        }
+    return summary
@@ -0,0 +1,120 @@
+import random
+from decimal import Decimal
+from io import StringIO
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import transaction
+from django.db.models import DecimalField, F, Sum
+from shop.caching import bump_catalogue_version
+from shop.models import Category, Order, OrderItem, Product, Rating
+from shop.recommendations import rebuild_related
+from shop.search import get_backend
+
+SYLLABLES = 'ba be bi bo ka ke ki ko la le li lo ma me mi mo na ne ni no ra re ri ro sa se si so ta te ti to'.split()
+PASSWORD = 'bench-password'
+USERNAME = 'bench-{}'
+BATCH_SIZE = 1000
+
+
+def vocabulary(rng, size=20_000):
+    # catalogue-like vocabulary: a few very common words and a long tail
+    return [''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) for _ in range(size)]
+
+
+def seed(categories=10, products=1000, users=50, ratings=2000, orders=500, seed=1):
+    """Fill an empty database with a reproducible synthetic shop.
+
+    Rows go in with bulk_create, which sends no signals, so the order
+    totals, rating aggregates, search index and related products are
+    rebuilt at the end, each in one pass. Returns the row counts.
+    """
+    rng = random.Random(seed)
+    words = vocabulary(rng, 2000)
+    sentence = lambda n: ' '.join(rng.choices(words, k=n))  # noqa: E731
+
+    with transaction.atomic():
+        category_objs = Category.objects.bulk_create(
+            Category(name=f'{words[i].title()} Goods', slug=f'bench-{i}-{words[i]}') for i in range(categories)
+        )
+        Product.objects.bulk_create((
+            Product(
+                category=rng.choice(category_objs), name=sentence(3).title(), slug=f'bench-product-{i}',
+                description=sentence(30), price=Decimal(rng.randint(100, 500_000)) / 100,
+                stock=1_000_000, available=rng.random() < 0.95, image='',
+            )
+            for i in range(products)
+        ), batch_size=BATCH_SIZE)
+        product_rows = list(Product.objects.filter(slug__startswith='bench-product-').values_list('id', 'price'))
+
+        # hashing is slow on purpose, every user shares one hash of the same password
+        password = make_password(PASSWORD)
+        User.objects.bulk_create(
+            (User(username=USERNAME.format(i), email=f'bench{i}@example.com', password=password) for i in range(users)),
+            batch_size=BATCH_SIZE,
+        )
+        user_ids = list(User.objects.filter(username__startswith='bench-').values_list('id', flat=True))
+
+        pairs = set()
+        while len(pairs) < min(ratings, len(product_rows) * len(user_ids)):
+            pairs.add((rng.choice(product_rows)[0], rng.choice(user_ids)))
+        Rating.objects.bulk_create(
+            (Rating(product_id=p, user_id=u, rating=rng.randint(1, 5), comment=sentence(8)) for p, u in pairs),
+            batch_size=BATCH_SIZE,
+        )
+
+        order_objs = Order.objects.bulk_create((
+            Order(
+                user_id=rng.choice(user_ids), first_name='Bench', last_name=str(i), email=f'order{i}@example.com',
+                address='Road 1', postal_code='1200', city='Dhaka', note='', paid=True, status='delivered',
+            )
+            for i in range(orders)
+        ), batch_size=BATCH_SIZE)
+        OrderItem.objects.bulk_create((
+            OrderItem(order=order, product_id=pid, price=price, quantity=rng.randint(1, 3))
+            for order in order_objs
+            for pid, price in rng.sample(product_rows, min(len(product_rows), rng.randint(1, 4)))
+        ), batch_size=BATCH_SIZE)
+        _update_totals()
+        call_command('rebuild_rating_aggregates', stdout=StringIO())
+        backend = get_backend()
+        if backend is not None:
+            backend.rebuild()
+    rebuild_related()
+    bump_catalogue_version()
+    return {
+        'categories': categories, 'products': products, 'users': users,
+        'ratings': len(pairs), 'orders': orders,
+    }
+
+
+def _update_totals():
+    money = DecimalField(max_digits=12, decimal_places=2)
+    totals = OrderItem.objects.values('order_id').annotate(
+        subtotal=Sum(F('price') * F('quantity'), output_field=money), item_count=Sum('quantity'),
+    )
+    Order.objects.bulk_update(
+        [Order(pk=row['order_id'], subtotal=row['subtotal'], item_count=row['item_count']) for row in totals],
+        ['subtotal', 'item_count'], batch_size=BATCH_SIZE,
+    )
+
+
+class Catalogue:
+    """What the flows pick from, read once per driver process."""
+
+    def __init__(self, products, categories, terms, usernames):
+        self.products = products  # [(id, slug)] of available products
+        self.categories = categories
+        self.terms = terms
+        self.usernames = usernames
+
+    @classmethod
+    def load(cls, limit=2000):
+        rows = list(Product.objects.available().order_by('id').values_list('id', 'slug', 'name')[:limit])
+        terms = sorted({word[:5] for _, _, name in rows for word in name.lower().split() if len(word) >= 4})
+        return cls(
+            products=[(pid, slug) for pid, slug, _ in rows],
+            categories=list(Category.objects.exclude(slug=None).values_list('slug', flat=True)),
+            terms=terms or ['a'],
+            usernames=list(User.objects.filter(username__startswith='bench-').order_by('id').values_list('username', flat=True)),
+        )
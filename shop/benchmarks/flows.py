@@ -0,0 +1,156 @@
+import requests
+from django.conf import settings
+from django.test import Client
+from django.urls import reverse
+from shop.models import Order
+from .data import PASSWORD
+
+CHECKOUT_FORM = {
+    'first_name': 'Bench', 'last_name': 'User', 'email': 'bench@example.com',
+    'address': 'Road 1', 'postal_code': '1200', 'city': 'Dhaka', 'note': 'benchmark',
+}
+
+
+class FlowError(Exception):
+    pass
+
+
+def _host():
+    # a name the host validation accepts; with DEBUG and no ALLOWED_HOSTS that is localhost
+    names = [host for host in settings.ALLOWED_HOSTS if host != '*' and not host.startswith('.')]
+    return names[0] if names else 'localhost'
+
+
+class ClientSession:
+    """Requests through the Django test client, in this process, no network."""
+
+    def __init__(self):
+        self.client = Client(SERVER_NAME=_host())
+
+    def get(self, path, params=None):
+        response = self.client.get(path, params or {})
+        return response.status_code, response.get('Location')
+
+    def post(self, path, data=None):
+        response = self.client.post(path, data or {})
+        return response.status_code, response.get('Location')
+
+
+class HttpSession:
+    """Requests over HTTP to ``base_url``, with cookies and CSRF like a browser."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+
+    def get(self, path, params=None):
+        response = self.session.get(self.base_url + path, params=params, allow_redirects=False, timeout=30)
+        return response.status_code, response.headers.get('Location')
+
+    def post(self, path, data=None):
+        if 'csrftoken' not in self.session.cookies:
+            # the login form sets the CSRF cookie
+            self.get(reverse('shop:login'))
+        response = self.session.post(
+            self.base_url + path, data=data or {}, allow_redirects=False, timeout=30,
+            headers={'X-CSRFToken': self.session.cookies.get('csrftoken', '')},
+        )
+        return response.status_code, response.headers.get('Location')
+
+
+def expect(result, status, location=None):
+    code, url = result
+    if code != status or (location is not None and url != location):
+        raise FlowError(f'expected {status} {location or ""}, got {code} {url or ""}'.strip())
+
+
+class Context:
+    """One simulated visitor: an anonymous session and a logged-in one."""
+
+    def __init__(self, make_session, catalogue, rng, username):
+        self.catalogue = catalogue
+        self.rng = rng
+        self.username = username
+        self.anonymous = make_session()
+        self.user = make_session()
+        expect(self.user.post(reverse('shop:login'), {'username': username, 'password': PASSWORD}), 302, reverse('shop:home'))
+
+    def product(self):
+        return self.rng.choice(self.catalogue.products)
+
+
+class Flow:
+    """One storefront flow. ``prepare`` is not timed, ``run`` is."""
+
+    name = None
+    weight = 1
+
+    def prepare(self, ctx):
+        return None
+
+    def run(self, ctx, state):
+        raise NotImplementedError
+
+
+class Browse(Flow):
+    name, weight = 'browse', 30
+
+    def run(self, ctx, state):
+        params = {'sort': ctx.rng.choice(['newest', 'price_asc', 'price_desc'])}
+        if ctx.catalogue.categories and ctx.rng.random() < 0.5:
+            path = reverse('shop:product_list_by_category', args=[ctx.rng.choice(ctx.catalogue.categories)])
+        else:
+            path = reverse('shop:product_list')
+        expect(ctx.anonymous.get(path, params), 200)
+
+
+class Search(Flow):
+    name, weight = 'search', 20
+
+    def run(self, ctx, state):
+        expect(ctx.anonymous.get(reverse('shop:product_list'), {'search': ctx.rng.choice(ctx.catalogue.terms)}), 200)
+
+
+class ProductDetail(Flow):
+    name, weight = 'product_detail', 30
+
+    def run(self, ctx, state):
+        _, slug = ctx.product()
+        expect(ctx.anonymous.get(reverse('shop:product_detail', args=[slug])), 200)
+
+
+class AddToCart(Flow):
+    name, weight = 'add_to_cart', 10
+
+    def run(self, ctx, state):
+        pid, slug = ctx.product()
+        expect(ctx.user.post(reverse('shop:cart_add', args=[pid])), 302, reverse('shop:product_detail', args=[slug]))
+
+
+class Checkout(Flow):
+    name, weight = 'checkout', 5
+
+    def prepare(self, ctx):
+        pid, _ = ctx.product()
+        expect(ctx.user.post(reverse('shop:cart_add', args=[pid])), 302)
+
+    def run(self, ctx, state):
+        # stops at the redirect to payment_process, which would call the gateway
+        expect(ctx.user.post(reverse('shop:checkout'), CHECKOUT_FORM), 302, reverse('shop:payment_process'))
+
+
+class PaymentSuccess(Flow):
+    """The gateway's success callback, posted by us instead of SSLCommerz."""
+
+    name, weight = 'payment_success', 5
+
+    def prepare(self, ctx):
+        Checkout().prepare(ctx)
+        expect(ctx.user.post(reverse('shop:checkout'), CHECKOUT_FORM), 302, reverse('shop:payment_process'))
+        return Order.objects.filter(user__username=ctx.username, paid=False).order_by('-id').values_list('id', flat=True)[0]
+
+    def run(self, ctx, order_id):
+        expect(ctx.user.post(reverse('shop:payment_sccess', args=[order_id])), 302, reverse('shop:home'))
+
+
+FLOWS = {flow.name: flow for flow in (Browse(), Search(), ProductDetail(), AddToCart(), Checkout(), PaymentSuccess())}
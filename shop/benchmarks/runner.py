@@ -0,0 +1,201 @@
+import json
+import math
+import multiprocessing
+import platform
+import random
+import subprocess
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone as dt_timezone
+from pathlib import Path
+import django
+import requests
+from django.apps import apps
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.db import connection, connections
+from .data import Catalogue
+from .flows import FLOWS, ClientSession, Context, FlowError, HttpSession
+
+
+def use_database(name):
+    """Point the default database at the SQLite file ``name``, for this process."""
+    connections.close_all()
+    settings.DATABASES['default']['NAME'] = str(name)
+    connections['default'].settings_dict['NAME'] = str(name)
+
+
+def drive(make_session, catalogue, flow_names, iterations, rng, username):
+    """One visitor running ``iterations`` weighted random flows.
+
+    Returns ``(samples, errors, first_errors, started, finished)`` with
+    samples in milliseconds per flow; logging in is not part of the window.
+    """
+    ctx = Context(make_session, catalogue, rng, username)
+    samples, errors, first_errors = {name: [] for name in flow_names}, Counter(), {}
+    weights = [FLOWS[name].weight for name in flow_names]
+    started = time.time()
+    for name in rng.choices(flow_names, weights, k=iterations):
+        flow = FLOWS[name]
+        try:
+            state = flow.prepare(ctx)
+            start = time.perf_counter()
+            flow.run(ctx, state)
+            samples[name].append((time.perf_counter() - start) * 1000)
+        except (FlowError, requests.RequestException) as e:
+            errors[name] += 1
+            first_errors.setdefault(name, str(e))
+    return samples, errors, first_errors, started, time.time()
+
+
+def run_client(flow_names, iterations, seed=1):
+    """All flows through the Django test client, in this process: the app's own cost, no network."""
+    catalogue = Catalogue.load()
+    if not catalogue.usernames:
+        raise FlowError('no bench-* users, seed the database first')
+    result = drive(ClientSession, catalogue, flow_names, iterations, random.Random(seed), catalogue.usernames[0])
+    return summarize([result])
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def start_server():
+    """This project's WSGI app on a free local port, one thread per request, like runserver."""
+    server = ThreadedWSGIServer(('127.0.0.1', 0), QuietHandler, allow_reuse_address=False)
+    server.set_app(WSGIHandler())
+    threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.1}, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def _init_worker(database):
+    # spawned (not forked) workers start without Django configured
+    if not apps.ready:
+        django.setup()
+    use_database(database)
+
+
+def _http_worker(args):
+    base_url, catalogue, flow_names, iterations, seed, username = args
+    return drive(lambda: HttpSession(base_url), catalogue, flow_names, iterations, random.Random(seed), username)
+
+
+def run_http(flow_names, iterations, workers, seed=1, base_url=None):
+    """The flows over HTTP from ``workers`` processes, each one visitor.
+
+    Without ``base_url`` the app is served from this process; with it, the
+    server must use this process's database, flows look up their orders there.
+    """
+    catalogue = Catalogue.load()
+    if not catalogue.usernames:
+        raise FlowError('no bench-* users, seed the database first')
+    database = connection.settings_dict['NAME']
+    connections.close_all()
+    method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+    # fork the workers before the server thread exists
+    with multiprocessing.get_context(method).Pool(workers, _init_worker, (database,)) as pool:
+        server = None
+        if base_url is None:
+            server, base_url = start_server()
+        try:
+            jobs = [
+                (base_url, catalogue, flow_names, iterations, seed + i, catalogue.usernames[i % len(catalogue.usernames)])
+                for i in range(workers)
+            ]
+            results = pool.map(_http_worker, jobs)
+        finally:
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+    return summarize(results)
+
+
+def percentile(ordered, p):
+    # nearest rank, so p99 of 100 samples is the 99th and not an interpolation
+    if not ordered:
+        return None
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def summarize(results):
+    """Merge the per-visitor results of ``drive`` into per-flow throughput and latency percentiles."""
+    samples, errors, first_errors = {}, Counter(), {}
+    for flow_samples, flow_errors, messages, _, _ in results:
+        for name, values in flow_samples.items():
+            samples.setdefault(name, []).extend(values)
+        errors.update(flow_errors)
+        for name, message in messages.items():
+            first_errors.setdefault(name, message)
+    wall = max(r[4] for r in results) - min(r[3] for r in results)
+    flows = {}
+    for name in sorted(samples):
+        ordered = sorted(samples[name])
+        flows[name] = {
+            'count': len(ordered),
+            'errors': errors[name],
+            'first_error': first_errors.get(name),
+            'throughput': round(len(ordered) / wall, 2) if wall else None,
+            'mean_ms': round(sum(ordered) / len(ordered), 3) if ordered else None,
+            **{f'p{p}_ms': round(percentile(ordered, p), 3) if ordered else None for p in (50, 95, 99)},
+        }
+    total = sum(flow['count'] for flow in flows.values())
+    return {'wall_seconds': round(wall, 3), 'throughput': round(total / wall, 2) if wall else None, 'flows': flows}
+
+
+def _git(*args):
+    try:
+        return subprocess.run(
+            ['git', *args], cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=10, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def describe(**meta):
+    """Where and on what a run happened, stored next to its numbers."""
+    return {
+        'created': datetime.now(dt_timezone.utc).isoformat(timespec='seconds'),
+        'commit': _git('rev-parse', 'HEAD'),
+        'dirty': bool(_git('status', '--porcelain', '--untracked-files=no')),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        **meta,
+    }
+
+
+def save(run, path):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(run, indent=2, sort_keys=True) + '\n')
+    return path
+
+
+def compare(baseline, current, threshold=0.10):
+    """Per-flow changes from ``baseline`` to ``current`` (two saved runs).
+
+    Returns ``(lines, regressed)``; a flow regresses when its p95 grows or
+    its throughput drops by more than ``threshold``, or when it starts failing.
+    """
+    lines, regressed = [], False
+    if baseline.get('mode') != current.get('mode'):
+        lines.append(f"baseline ran in {baseline.get('mode')} mode, this run in {current.get('mode')}")
+    for name, now in sorted(current['flows'].items()):
+        before = baseline['flows'].get(name)
+        if not before or not before['p95_ms'] or not now['p95_ms']:
+            continue
+        p95 = now['p95_ms'] / before['p95_ms'] - 1
+        throughput = now['throughput'] / before['throughput'] - 1 if before['throughput'] else 0.0
+        failing = now['errors'] > 0 and before['errors'] == 0
+        bad = p95 > threshold or throughput < -threshold or failing
+        regressed |= bad
+        lines.append(
+            f"{name:<16} p95 {before['p95_ms']:>9.2f} -> {now['p95_ms']:>9.2f} ms ({p95:+.0%})  "
+            f"throughput {throughput:+.0%}  errors {before['errors']} -> {now['errors']}"
+            + ('  REGRESSION' if bad else '')
+        )
+    return lines, regressed
@@ -0,0 +1,182 @@
+import hashlib
+import re
+import threading
+import time
+from collections import Counter
+from functools import wraps
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from .cart import GuestCart
+from .replicas import current_replica, replicas
+from .utils import aget_user
+
+VERSION_KEY = 'shop:catalogue:version'
+# set for REPLICA_PIN_SECONDS after each bump, while replicas may still miss the change
+BUMPED_KEY = 'shop:catalogue:bumped'
+CSRF_INPUT_RE = re.compile(r'(name="csrfmiddlewaretoken" value=")[^"]*(")')
+
+
+def timeout():
+    return getattr(settings, 'CATALOGUE_CACHE_TIMEOUT', 300)
+
+
+def get_catalogue_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # start from the clock, so a version lost to eviction never comes back
+        # with a number that old entries were stored under
+        cache.add(VERSION_KEY, int(time.time()), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+async def aget_catalogue_version():
+    version = await cache.aget(VERSION_KEY)
+    if version is None:
+        await cache.aadd(VERSION_KEY, int(time.time()), None)
+        version = await cache.aget(VERSION_KEY)
+    return version
+
+
+def bump_catalogue_version():
+    """Make every cached page and fragment stale at once.
+
+    Keys embed the version, so nothing is deleted: old entries are simply
+    never read again and expire on their own.
+    """
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        get_catalogue_version()
+    if replicas():
+        cache.set(BUMPED_KEY, True, getattr(settings, 'REPLICA_PIN_SECONDS', 10))
+
+
+def replica_may_lag():
+    """Whether this request read a replica that may not have the last catalogue change yet.
+
+    What it rendered would be stored under the new version with the old
+    data, and served until the next change, so it is not cached.
+    """
+    return current_replica() is not None and cache.get(BUMPED_KEY) is not None
+
+
+async def areplica_may_lag():
+    return current_replica() is not None and await cache.aget(BUMPED_KEY) is not None
+
+
+class CacheStats:
+    """Hit/miss counters per cache layer, for this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = Counter()
+
+    def record(self, layer, hit):
+        with self._lock:
+            self._counts[layer, 'hit' if hit else 'miss'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counts)
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+
+stats = CacheStats()
+
+
+def refresh_csrf(content, token):
+    # cached HTML holds the CSRF token of whoever filled the cache, swap in the current one
+    return CSRF_INPUT_RE.sub(lambda m: m.group(1) + token + m.group(2), content)
+
+
+def _digest(*parts):
+    return hashlib.md5(':'.join(str(p) for p in parts).encode()).hexdigest()
+
+
+def page_cache_key(request, version=None):
+    # ?b=2&a=1, ?a=1&b=2 and ?a=1&b=2&c= all render the same page
+    params = sorted((k, v) for k, values in request.GET.lists() for v in values if v)
+    if version is None:
+        version = get_catalogue_version()
+    return f'shop:page:{version}:{_digest(request.path, params)}'
+
+
+def fragment_cache_key(name, vary_on):
+    return f'shop:fragment:{get_catalogue_version()}:{name}:{_digest(*vary_on)}'
+
+
+def _always_render(request):
+    # the cheap checks; messages and logged-in users are checked after them, both may query
+    return request.method != 'GET' or GuestCart.COOKIE in request.COOKIES
+
+
+def _may_have_messages(request):
+    return CookieStorage.cookie_name in request.COOKIES or settings.SESSION_COOKIE_NAME in request.COOKIES
+
+
+def _has_messages(request):
+    # FallbackStorage keeps what does not fit its cookie in the session; len() loads both
+    storage = getattr(request, '_messages', None)
+    return storage is not None and len(storage) > 0
+
+
+def _from_cache(request, cached):
+    stats.record('page', cached is not None)
+    if cached is not None:
+        content, content_type = cached
+        return HttpResponse(refresh_csrf(content, get_token(request)), content_type=content_type)
+
+
+def _cacheable(response):
+    if response.status_code == 200 and not response.streaming:
+        return response.content.decode(response.charset), response['Content-Type']
+
+
+def cache_catalogue_page(view):
+    """Serve whole catalogue pages from the cache for anonymous visitors.
+
+    Logged-in users see their cart and rating forms, guests with a cart see
+    its badge, and a visitor with a pending flash message must see it, so
+    those requests always render. Pages read from a replica right after a
+    catalogue change are not stored. Async views get an async wrapper.
+    """
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            if (_always_render(request)
+                    or (_may_have_messages(request) and await sync_to_async(_has_messages)(request))
+                    or (await aget_user(request)).is_authenticated):
+                return await view(request, *args, **kwargs)
+            key = page_cache_key(request, await aget_catalogue_version())
+            response = _from_cache(request, await cache.aget(key))
+            if response is None:
+                response = await view(request, *args, **kwargs)
+                entry = _cacheable(response)
+                if entry and not await areplica_may_lag():
+                    await cache.aset(key, entry, timeout())
+            return response
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if (_always_render(request)
+                or (_may_have_messages(request) and _has_messages(request))
+                or request.user.is_authenticated):
+            return view(request, *args, **kwargs)
+        key = page_cache_key(request)
+        response = _from_cache(request, cache.get(key))
+        if response is None:
+            response = view(request, *args, **kwargs)
+            entry = _cacheable(response)
+            if entry and not replica_may_lag():
+                cache.set(key, entry, timeout())
+        return response
+    return wrapper
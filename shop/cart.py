@@ -0,0 +1,197 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from .models import Cart, CartItem, Product
+
+
+def summary_key(user_id):
+    return f'shop:cart_summary:{user_id}'
+
+
+def get_cart_summary(request):
+    """Item count and total price of the user's cart, cached per user.
+
+    The cart mutations below, checkout and product changes delete the entry,
+    so every session of the user reads the same badge without touching the
+    cart tables. CART_SUMMARY_TIMEOUT bounds how long a summary computed
+    while the cart changed underneath can survive.
+    """
+    key = summary_key(request.user.pk)
+    summary = cache.get(key)
+    if summary is None:
+        summary = CartItem.objects.filter(cart__user=request.user).totals()
+        cache.set(key, summary, getattr(settings, 'CART_SUMMARY_TIMEOUT', 300))
+    return summary
+
+
+def invalidate_cart_summary(user_id):
+    # after commit, or a page rendered in between caches the old cart again
+    transaction.on_commit(lambda: cache.delete(summary_key(user_id)))
+
+
+async def ainvalidate_cart_summary(user_id):
+    # the async mutations run in autocommit, their writes are already visible
+    await cache.adelete(summary_key(user_id))
+
+
+def invalidate_cart_summaries(products):
+    """Drop the summaries of every cart holding one of ``products`` (ids or a queryset): prices changed."""
+    user_ids = CartItem.objects.filter(product__in=products).values_list('cart__user_id', flat=True).distinct()
+    keys = [summary_key(user_id) for user_id in user_ids]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def get_cart(user):
+    return Cart.objects.get_or_create(user=user)[0]
+
+
+async def aget_cart(user):
+    return (await Cart.objects.aget_or_create(user=user))[0]
+
+
+# Cart mutations. Each is at most two statements and never reads a quantity
+# back into Python, so concurrent clicks cannot lose an increment; the unique
+# (cart, product) constraint makes a racing second insert fall back to the update.
+
+def add(cart, product_id, quantity=1):
+    item, created = CartItem.objects.get_or_create(cart=cart, product_id=product_id, defaults={'quantity': quantity})
+    if not created:
+        CartItem.objects.filter(pk=item.pk).update(quantity=F('quantity') + quantity)
+    invalidate_cart_summary(cart.user_id)
+    return created
+
+
+def set_quantity(cart, product_id, quantity):
+    """Returns False if the product is not in the cart. Zero or less removes it."""
+    if quantity <= 0:
+        return remove(cart, product_id)
+    updated = CartItem.objects.filter(cart=cart, product_id=product_id).update(quantity=quantity) > 0
+    invalidate_cart_summary(cart.user_id)
+    return updated
+
+
+def remove(cart, product_id):
+    deleted, _ = CartItem.objects.filter(cart=cart, product_id=product_id).delete()
+    invalidate_cart_summary(cart.user_id)
+    return deleted > 0
+
+
+# the same statements from async views
+
+async def aadd(cart, product_id, quantity=1):
+    item, created = await CartItem.objects.aget_or_create(cart=cart, product_id=product_id, defaults={'quantity': quantity})
+    if not created:
+        await CartItem.objects.filter(pk=item.pk).aupdate(quantity=F('quantity') + quantity)
+    await ainvalidate_cart_summary(cart.user_id)
+    return created
+
+
+async def aset_quantity(cart, product_id, quantity):
+    if quantity <= 0:
+        return await aremove(cart, product_id)
+    updated = await CartItem.objects.filter(cart=cart, product_id=product_id).aupdate(quantity=quantity) > 0
+    await ainvalidate_cart_summary(cart.user_id)
+    return updated
+
+
+async def aremove(cart, product_id):
+    deleted, _ = await CartItem.objects.filter(cart=cart, product_id=product_id).adelete()
+    await ainvalidate_cart_summary(cart.user_id)
+    return deleted > 0
+
+
+class GuestCart:
+    """Cart of a visitor who is not logged in, kept in a signed cookie.
+
+    The cookie holds only ``product_id:quantity`` pairs, so browsing and
+    filling a cart never writes to the database. merge_guest_cart() moves
+    it into the Cart tables when the visitor logs in or registers.
+    """
+
+    COOKIE = 'guest_cart'
+    SALT = 'shop.guest_cart'
+    MAX_AGE = 60 * 60 * 24 * 14
+    MAX_LINES = 50
+    MAX_QUANTITY = 99
+
+    def __init__(self, request):
+        self.lines = self._decode(request.get_signed_cookie(self.COOKIE, default='', salt=self.SALT))
+
+    @classmethod
+    def _decode(cls, value):
+        lines = {}
+        try:
+            for pair in filter(None, value.split(',')):
+                product_id, quantity = map(int, pair.split(':'))
+                if product_id > 0 and quantity > 0:
+                    lines[product_id] = min(quantity, cls.MAX_QUANTITY)
+        except ValueError:
+            return {}
+        return dict(list(lines.items())[:cls.MAX_LINES])
+
+    def __bool__(self):
+        return bool(self.lines)
+
+    def add(self, product_id, quantity=1):
+        if product_id in self.lines or len(self.lines) < self.MAX_LINES:
+            self.lines[product_id] = min(self.lines.get(product_id, 0) + quantity, self.MAX_QUANTITY)
+
+    def set_quantity(self, product_id, quantity):
+        if quantity <= 0:
+            self.remove(product_id)
+        elif product_id in self.lines:
+            self.lines[product_id] = min(quantity, self.MAX_QUANTITY)
+
+    def remove(self, product_id):
+        self.lines.pop(product_id, None)
+
+    def count(self):
+        return sum(self.lines.values())
+
+    def items(self):
+        # unsaved CartItems, so cart.html renders guest and user carts alike
+        return self._items(Product.objects.select_related('category').in_bulk(self.lines))
+
+    async def aitems(self):
+        return self._items(await Product.objects.select_related('category').ain_bulk(self.lines))
+
+    def _items(self, products):
+        return [
+            CartItem(product=products[pid], quantity=quantity)
+            for pid, quantity in self.lines.items() if pid in products
+        ]
+
+    def save(self, response):
+        if self.lines:
+            value = ','.join(f'{pid}:{quantity}' for pid, quantity in self.lines.items())
+            response.set_signed_cookie(
+                self.COOKIE, value, salt=self.SALT, max_age=self.MAX_AGE, httponly=True, samesite='Lax'
+            )
+        else:
+            self.clear(response)
+
+    @classmethod
+    def clear(cls, response):
+        response.delete_cookie(cls.COOKIE, samesite='Lax')
+
+
+def merge_guest_cart(request, user, response):
+    """Add the guest cart to ``user``'s Cart in one upsert and drop the cookie."""
+    guest = GuestCart(request)
+    if not guest:
+        return
+    with transaction.atomic():
+        cart, _ = Cart.objects.get_or_create(user=user)
+        lines = dict(guest.lines)
+        existing = CartItem.objects.select_for_update().filter(cart=cart, product__in=lines)
+        for product_id, quantity in existing.values_list('product_id', 'quantity'):
+            lines[product_id] += quantity
+        valid = set(Product.objects.filter(id__in=lines).values_list('id', flat=True))
+        CartItem.objects.bulk_create(
+            [CartItem(cart=cart, product_id=pid, quantity=quantity) for pid, quantity in lines.items() if pid in valid],
+            update_conflicts=True, unique_fields=['cart', 'product'], update_fields=['quantity'],
+        )
+    invalidate_cart_summary(user.pk)
+    GuestCart.clear(response)
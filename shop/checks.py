@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+# backends whose entries live in one process; a delete in one worker leaves the
+# others serving the old catalogue version and the old cart badges
+PROCESS_LOCAL_CACHES = ('django.core.cache.backends.locmem.LocMemCache',)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [
+        Warning(
+            f'The default cache ({backend}) is local to each process.',
+            hint='Set CACHE_URL to a Redis or Memcached server shared by all workers, '
+            'the catalogue version and the cart badges are invalidated through it.',
+            id='shop.W001',
+        )
+    ]
@@ -1,11 +1,7 @@
-from .models import Cart
+from .cart import GuestCart, get_cart_summary
 def cart_items_count(request):
     if request.user.is_authenticated:
-        try:
-            cart = Cart.objects.get(user=request.user)
-            return {'cart_items_count': cart.get_total_items()}
-        except Cart.DoesNotExist:
-            return {'cart_items_count':0}
-    return {'cart_items_count':0}
-
-        
\ No newline at end of file
+        summary = get_cart_summary(request)
+        return {'cart_items_count': summary['items'], 'cart_total': summary['total']}
+    # guests: counted from the cookie, no database access
+    return {'cart_items_count':GuestCart(request).count()}
@@ -0,0 +1,134 @@
+from decimal import Decimal, InvalidOperation
+from django.db.models import Count, Max, Min, Q
+
+STAR_LEVELS = (5, 4, 3, 2, 1)
+# every ordering ends in id so the keyset is unique
+PRODUCT_SORTS = {
+    'newest': ('-created', '-id'),
+    'price_asc': ('price', 'id'),
+    'price_desc': ('-price', '-id'),
+    # only with ?search=, search_rank is annotated by shop.search
+    'relevance': ('-search_rank', '-id'),
+}
+
+
+class ProductFilters:
+    """The user filters of product_list and the API, parsed once from the query string."""
+
+    def __init__(self, params):
+        self.search = params.get('search') or ''
+        self.min_price = self._decimal(params.get('min_price'))
+        self.max_price = self._decimal(params.get('max_price'))
+        self.rating = self._star(params.get('rating'))
+        self.in_stock = params.get('in_stock') == '1'
+        self.sort = self._sort(params.get('sort'))
+
+    def _sort(self, value):
+        # searches rank by relevance unless asked otherwise, relevance needs a search
+        if self.search:
+            return value if value in PRODUCT_SORTS else 'relevance'
+        return value if value in PRODUCT_SORTS and value != 'relevance' else 'newest'
+
+    def ordering(self):
+        return PRODUCT_SORTS[self.sort]
+
+    @staticmethod
+    def _decimal(value):
+        try:
+            number = Decimal(value) if value else None
+        except InvalidOperation:
+            return None
+        # NaN and Infinity parse, but the price lookup rejects them
+        return number if number is not None and number.is_finite() else None
+
+    @staticmethod
+    def _star(value):
+        return int(value) if value in {str(k) for k in STAR_LEVELS} else None
+
+    def price_q(self):
+        q = Q()
+        if self.min_price is not None:
+            q &= Q(price__gte=self.min_price)
+        if self.max_price is not None:
+            q &= Q(price__lte=self.max_price)
+        return q
+
+    def rating_q(self):
+        return Q(rating_avg__gte=self.rating) if self.rating else Q()
+
+    def stock_q(self):
+        return Q(stock__gt=0) if self.in_stock else Q()
+
+    def q(self):
+        return self.price_q() & self.rating_q() & self.stock_q()
+
+
+class CategoryFacet:
+    def __init__(self, id, name, slug, count):
+        self.id = id
+        self.name = name
+        self.slug = slug
+        self.count = count
+
+
+class Facets:
+    def __init__(self, categories, min_price, max_price, rating_counts, in_stock, total):
+        self.categories = categories
+        self.min_price = min_price
+        self.max_price = max_price
+        self.rating_counts = rating_counts  # {stars: products rated stars or more}
+        self.in_stock = in_stock
+        self.total = total
+
+
+def compute_facets(products, filters, category=None):
+    """All sidebar facets for ``products`` in one GROUP BY category query.
+
+    ``products`` has the shared filters applied (available, search) but not
+    the category or the sidebar filters. Each facet is a conditional
+    aggregate that applies every filter except its own, so picking a value
+    in one facet does not hide the alternatives in that facet.
+    """
+    return build_facets(list(facet_rows(products, filters)), category)
+
+
+async def acompute_facets(products, filters, category=None):
+    return build_facets([row async for row in facet_rows(products, filters)], category)
+
+
+def facet_rows(products, filters):
+    price, rating, stock = filters.price_q(), filters.rating_q(), filters.stock_q()
+    aggregates = {
+        'count': Count('id', filter=price & rating & stock),
+        'min_price': Min('price', filter=rating & stock),
+        'max_price': Max('price', filter=rating & stock),
+        'in_stock': Count('id', filter=price & rating & Q(stock__gt=0)),
+    }
+    for stars in STAR_LEVELS:
+        aggregates[f'stars_{stars}'] = Count('id', filter=price & stock & Q(rating_avg__gte=stars))
+    return (
+        products.order_by()
+        .values('category_id', 'category__name', 'category__slug')
+        .annotate(**aggregates)
+        .order_by('category__name')
+    )
+
+
+def build_facets(rows, category=None):
+    categories = [
+        CategoryFacet(row['category_id'], row['category__name'], row['category__slug'], row['count'])
+        for row in rows
+    ]
+    # everything but the category facet is about the selected category only
+    if category is not None:
+        rows = [row for row in rows if row['category_id'] == category.id]
+    prices_min = [row['min_price'] for row in rows if row['min_price'] is not None]
+    prices_max = [row['max_price'] for row in rows if row['max_price'] is not None]
+    return Facets(
+        categories=categories,
+        min_price=min(prices_min, default=None),
+        max_price=max(prices_max, default=None),
+        rating_counts={stars: sum(row[f'stars_{stars}'] for row in rows) for stars in STAR_LEVELS},
+        in_stock=sum(row['in_stock'] for row in rows),
+        total=sum(row['count'] for row in rows),
+    )
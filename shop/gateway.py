@@ -0,0 +1,134 @@
+import logging
+import threading
+import time
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+
+class GatewayError(Exception):
+    pass
+
+
+class CircuitOpen(GatewayError):
+    pass
+
+
+class CircuitBreaker:
+    """Stops calling a failing service for ``reset_after`` seconds.
+
+    After ``threshold`` consecutive failures the circuit opens and calls
+    fail immediately; once ``reset_after`` has passed one trial call is let
+    through and its result closes or re-opens the circuit.
+    """
+
+    def __init__(self, threshold=5, reset_after=30, clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.opened_at is None:
+                return
+            if self.clock() - self.opened_at < self.reset_after:
+                raise CircuitOpen('payment gateway circuit is open')
+            # half open: allow this call, a failure re-opens right away
+            self.opened_at = None
+            self.failures = self.threshold - 1
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = self.clock()
+
+
+class SSLCommerzClient:
+    """HTTP client for the SSLCommerz API.
+
+    One keep-alive ``requests.Session`` per process reuses TCP/TLS
+    connections between checkouts. Every call has connect/read timeouts,
+    connection errors and 502/503/504 are retried with exponential
+    backoff, and a circuit breaker fails fast while the gateway is down.
+    """
+
+    def __init__(self, connect_timeout=3.05, read_timeout=10, retries=2, backoff=0.3,
+                 pool_size=10, breaker=None):
+        self.timeout = (connect_timeout, read_timeout)
+        self.breaker = breaker or CircuitBreaker()
+        self.session = requests.Session()
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            # a read timeout may mean the gateway got the request, do not send it twice
+            read=0,
+            status=retries,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(['GET', 'POST']),
+            backoff_factor=backoff,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            connect_timeout=getattr(settings, 'SSLCOMMERZ_CONNECT_TIMEOUT', 3.05),
+            read_timeout=getattr(settings, 'SSLCOMMERZ_READ_TIMEOUT', 10),
+            retries=getattr(settings, 'SSLCOMMERZ_RETRIES', 2),
+            backoff=getattr(settings, 'SSLCOMMERZ_BACKOFF', 0.3),
+            pool_size=getattr(settings, 'SSLCOMMERZ_POOL_SIZE', 10),
+            breaker=CircuitBreaker(
+                threshold=getattr(settings, 'SSLCOMMERZ_BREAKER_THRESHOLD', 5),
+                reset_after=getattr(settings, 'SSLCOMMERZ_BREAKER_RESET', 30),
+            ),
+        )
+
+    def post(self, url, data):
+        self.breaker.before_call()
+        try:
+            response = self.session.post(url, data=data, timeout=self.timeout)
+            response.raise_for_status()
+            payload = response.json()
+        except (requests.RequestException, ValueError) as e:
+            self.breaker.record_failure()
+            logger.warning('sslcommerz request to %s failed: %s', url, e)
+            raise GatewayError(str(e)) from e
+        self.breaker.record_success()
+        return payload
+
+    def init_payment(self, post_data):
+        return self.post(settings.SSLCOMMERZ_PAYMENT_URL, post_data)
+
+    async def ainit_payment(self, post_data):
+        # requests blocks, so the call waits in a pool thread of its own and the
+        # event loop and the request's ORM thread stay free for other requests
+        return await sync_to_async(self.init_payment, thread_sensitive=False)(post_data)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = SSLCommerzClient.from_settings()
+    return _client
@@ -0,0 +1,94 @@
+import hashlib
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# derivative format -> (Pillow format, file extension, save options)
+FORMATS = {
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def widths():
+    return tuple(getattr(settings, 'PRODUCT_IMAGE_WIDTHS', (320, 640, 960)))
+
+
+def derivative_name(digest, width, fmt):
+    return f'products/derived/{digest[:2]}/{digest}-{width}.{FORMATS[fmt][1]}'
+
+
+def derivative_url(derivatives, width, fmt):
+    return default_storage.url(derivative_name(derivatives['digest'], width, fmt))
+
+
+def _encode(image, fmt):
+    pil_format, _, options = FORMATS[fmt]
+    if pil_format == 'JPEG' and image.mode != 'RGB':
+        # JPEG has no alpha, flatten onto white like the card background
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A') if 'A' in image.getbands() else None)
+        image = background
+    buffer = BytesIO()
+    image.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def generate_derivatives(name):
+    """Write the resized WebP/JPEG copies of the stored image ``name``.
+
+    Files are named after a hash of the original bytes, so re-uploading the
+    same picture or running a backfill twice reuses what is already there.
+    Images are never upscaled. Returns what Product.image_derivatives stores.
+    """
+    with default_storage.open(name, 'rb') as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()[:32]
+    with Image.open(BytesIO(data)) as original:
+        original = ImageOps.exif_transpose(original)
+        if original.mode not in ('RGB', 'RGBA'):
+            original = original.convert('RGBA' if 'transparency' in original.info or original.mode in ('LA', 'PA') else 'RGB')
+        targets = sorted({min(width, original.width) for width in widths()})
+        for width in targets:
+            pending = [fmt for fmt in FORMATS if not default_storage.exists(derivative_name(digest, width, fmt))]
+            if not pending:
+                continue
+            resized = original.resize((width, max(1, round(original.height * width / original.width))), Image.LANCZOS)
+            for fmt in pending:
+                default_storage.save(derivative_name(digest, width, fmt), ContentFile(_encode(resized, fmt)))
+    return {'source': name, 'digest': digest, 'widths': targets}
+
+
+def _safe_generate(name):
+    try:
+        return name, generate_derivatives(name)
+    except (OSError, ValueError) as e:
+        # missing or unreadable file, keep serving the original
+        logger.warning('could not derive images for %s: %s', name, e)
+        return name, None
+
+
+def _init_worker():
+    # spawned (not forked) workers start without Django configured
+    import django
+    django.setup()
+
+
+def generate_many(names, workers=None):
+    """Derive many images in parallel, yielding ``(name, derivatives or None)``.
+
+    Resizing is CPU bound, so a process pool sidesteps the GIL. Workers only
+    touch files; the caller writes the results to the database.
+    """
+    names = list(dict.fromkeys(names))
+    if workers == 1 or len(names) < 2:
+        yield from map(_safe_generate, names)
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        yield from pool.map(_safe_generate, names, chunksize=4)
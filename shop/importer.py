@@ -0,0 +1,367 @@
+import csv
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import slugify
+from .caching import bump_catalogue_version
+from .cart import invalidate_cart_summaries
+from .images import generate_many
+from .models import Category, Product
+from .search import get_backend
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+FETCH_WORKERS = 8
+FETCH_TIMEOUT = 10
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+MAX_PRICE = Decimal('99999999.99')  # max_digits=10, decimal_places=2
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.gif'}
+TRUE, FALSE = {'1', 'true', 'yes', 'y'}, {'0', 'false', 'no', 'n'}
+# written on conflict; rating_* and created belong to the existing row
+UPSERT_FIELDS = ['name', 'category', 'description', 'price', 'stock', 'available', 'updated']
+
+
+class RowError(ValueError):
+    pass
+
+
+def read_feed(f, fmt):
+    """``(line number, row)`` pairs from an open CSV or JSONL feed, one at a time.
+
+    A JSONL line that does not parse comes out as ``None`` so it is reported
+    with the other invalid rows instead of stopping the import.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(f)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for number, line in enumerate(f, 1):
+        if line.strip():
+            try:
+                yield number, json.loads(line)
+            except ValueError:
+                yield number, None
+
+
+def _decimal(value):
+    try:
+        price = Decimal(str(value).strip()).quantize(Decimal('0.01'))
+    except (InvalidOperation, ValueError):
+        raise RowError(f'price {value!r} is not a number')
+    if not 0 <= price <= MAX_PRICE:
+        raise RowError(f'price {value!r} is out of range')
+    return price
+
+
+def _int(value, name):
+    try:
+        number = int(str(value).strip())
+    except ValueError:
+        raise RowError(f'{name} {value!r} is not a whole number')
+    if number < 0:
+        raise RowError(f'{name} {value!r} is negative')
+    return number
+
+
+def _bool(value):
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in TRUE:
+        return True
+    if text in FALSE:
+        return False
+    raise RowError(f'available {value!r} is not yes/no')
+
+
+def clean_row(row):
+    """The Product values of one feed row, or RowError saying what is wrong with it."""
+    if not isinstance(row, dict):
+        raise RowError('not a JSON object')
+    name = str(row.get('name') or '').strip()
+    if not name:
+        raise RowError('name is required')
+    if len(name) > 200:
+        raise RowError('name is longer than 200 characters')
+    category = str(row.get('category') or '').strip()
+    if not category:
+        raise RowError('category is required')
+    if row.get('price') in (None, ''):
+        raise RowError('price is required')
+    slug = slugify(row.get('slug') or '')[:200].strip('-')
+    return {
+        'name': name,
+        'slug': slug or slugify(name)[:200].strip('-'),
+        'explicit_slug': bool(slug),
+        'category': category,
+        'description': str(row.get('description') or ''),
+        'price': _decimal(row['price']),
+        'stock': _int(row['stock'], 'stock') if row.get('stock') not in (None, '') else 0,
+        'available': _bool(row['available']) if row.get('available') not in (None, '') else True,
+        'image': str(row.get('image') or '').strip(),
+    }
+
+
+class ExistingProducts:
+    """The products a batch may update, by slug.
+
+    One query for the batch's slugs, and one more for each slug that needs
+    a suffix, to see which of its numbered forms are taken.
+    """
+
+    def __init__(self, slugs):
+        self.rows = self._load(slug__in=slugs)
+        self.suffixed = set()
+
+    @staticmethod
+    def _load(**lookup):
+        return {
+            slug: (name, image, derivatives)
+            for slug, name, image, derivatives in Product.objects.filter(**lookup)
+            .values_list('slug', 'name', 'image', 'image_derivatives')
+        }
+
+    def __contains__(self, slug):
+        return slug in self.rows
+
+    def held_by_other(self, slug, name):
+        return slug in self.rows and self.rows[slug][0] != name
+
+    def load_suffixes(self, base):
+        if base not in self.suffixed:
+            self.suffixed.add(base)
+            self.rows.update(self._load(slug__regex=rf'^{re.escape(base)}-[0-9]+$'))
+
+
+class SlugAllocator:
+    """Unique slugs for one import without a query per row.
+
+    The slug is the product's key: a row naming its slug updates that
+    product, and so does a row whose name-derived slug belongs to a product
+    of the same name. Any other name-derived slug taken by an earlier row
+    of the feed or by an existing product gets -2, -3, ... so the upsert
+    never overwrites an unrelated product.
+    """
+
+    def __init__(self):
+        self.taken = set()
+
+    def allocate(self, slug, explicit, name, existing):
+        if not slug:
+            raise RowError('name has no characters usable in a slug')
+        if explicit:
+            if slug in self.taken:
+                raise RowError(f'slug {slug!r} appears twice in the feed')
+            self.taken.add(slug)
+            return slug
+        base, n = slug, 2
+        while slug in self.taken or existing.held_by_other(slug, name):
+            existing.load_suffixes(base)
+            suffix = f'-{n}'
+            slug, n = base[:200 - len(suffix)] + suffix, n + 1
+        self.taken.add(slug)
+        return slug
+
+
+class CategoryResolver:
+    """Category ids by name or slug, loaded once; unknown categories are created."""
+
+    def __init__(self):
+        self.ids = {}
+        for pk, name, slug in Category.objects.values_list('id', 'name', 'slug'):
+            self.ids[name.lower()] = pk
+            if slug:
+                self.ids.setdefault(slug, pk)
+
+    def resolve(self, value):
+        key = value.lower()
+        pk = self.ids.get(key) or self.ids.get(slugify(value))
+        if pk is None:
+            pk = Category.objects.create(name=value[:100], slug=slugify(value)[:100] or None).pk
+            self.ids[key] = pk
+        return pk
+
+
+def image_name(source):
+    """Where a feed image lives in storage; URLs map to a stable name so a re-import skips the download."""
+    url = urlparse(source)
+    if url.scheme not in ('http', 'https'):
+        return source
+    ext = os.path.splitext(url.path)[1].lower()
+    digest = hashlib.sha1(source.encode()).hexdigest()
+    return f'products/imported/{digest[:2]}/{digest}{ext if ext in IMAGE_EXTENSIONS else ".jpg"}'
+
+
+def fetch_image(session, url, name):
+    if default_storage.exists(name):
+        return name
+    with session.get(url, timeout=FETCH_TIMEOUT, stream=True) as response:
+        response.raise_for_status()
+        data = response.raw.read(MAX_IMAGE_BYTES + 1, decode_content=True)
+    if len(data) > MAX_IMAGE_BYTES:
+        raise ValueError(f'larger than {MAX_IMAGE_BYTES} bytes')
+    return default_storage.save(name, ContentFile(data))
+
+
+class ImportStats:
+    def __init__(self, max_errors=20):
+        self.started = time.monotonic()
+        self.rows = self.created = self.updated = self.invalid = 0
+        self.images = self.image_failures = 0
+        self.errors = []  # (line number, message), the first max_errors of them
+        self.max_errors = max_errors
+
+    def reject(self, number, error):
+        self.invalid += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append((number, str(error)))
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def rate(self):
+        return self.rows / max(self.elapsed(), 1e-9)
+
+
+def _batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class ProductImporter:
+    """Upsert a product feed in batches, fetching and resizing each batch's images.
+
+    Each batch is validated in Python, checked against the database with one
+    query and written with one ``bulk_create(update_conflicts=True)``; its
+    images are then downloaded by a thread pool and resized by the process
+    pool of shop.images, so memory is bounded by the batch size. A product
+    keeps its previous image until the new one is ready.
+    """
+
+    def __init__(self, batch_size=BATCH_SIZE, fetch_workers=FETCH_WORKERS, derive_workers=None,
+                 with_images=True, progress=None):
+        self.batch_size = batch_size
+        self.fetch_workers = fetch_workers
+        self.derive_workers = derive_workers
+        self.with_images = with_images
+        self.progress = progress or (lambda stats: None)
+        self.stats = ImportStats()
+        self.slugs = SlugAllocator()
+        self.categories = CategoryResolver()
+        self.pending = {}  # image name -> (url or None, [slugs]) of the current batch
+        self.search = get_backend()
+
+    def run(self, rows):
+        for batch in _batched(rows, self.batch_size):
+            self._write(batch)
+            if self.with_images and self.pending:
+                self._process_images()
+            self.progress(self.stats)
+        if self.stats.created or self.stats.updated:
+            bump_catalogue_version()
+        return self.stats
+
+    def _write(self, batch):
+        cleaned = []
+        for number, row in batch:
+            self.stats.rows += 1
+            try:
+                cleaned.append((number, clean_row(row)))
+            except RowError as e:
+                self.stats.reject(number, e)
+        if not cleaned:
+            return
+
+        existing = ExistingProducts([values['slug'] for _, values in cleaned])
+        rows = []
+        for number, values in cleaned:
+            try:
+                values['slug'] = self.slugs.allocate(values['slug'], values.pop('explicit_slug'), values['name'], existing)
+                values['category_id'] = self.categories.resolve(values.pop('category'))
+            except RowError as e:
+                self.stats.reject(number, e)
+                continue
+            rows.append(values)
+        if not rows:
+            return
+
+        updated = [values['slug'] for values in rows if values['slug'] in existing]
+        products = []
+        for values in rows:
+            source = values.pop('image')
+            _, image, derivatives = existing.rows.get(values['slug'], (None, '', {}))
+            if source and self.with_images:
+                name = image_name(source)
+                if name != image or derivatives.get('source') != name:
+                    url = source if name != source else None
+                    self.pending.setdefault(name, (url, []))[1].append(values['slug'])
+            products.append(Product(**values, image=image, image_derivatives=derivatives))
+
+        with transaction.atomic():
+            saved = Product.objects.bulk_create(
+                products, update_conflicts=True, unique_fields=['slug'], update_fields=UPSERT_FIELDS,
+            )
+            if self.search is not None:
+                # bulk_create sends no post_save, so index here
+                ids = [p.pk for p in saved]
+                if None in ids:
+                    ids = list(Product.objects.filter(slug__in=[p.slug for p in products]).values_list('id', flat=True))
+                self.search.index_products(ids)
+            if updated:
+                # bulk_create skips product_saved too, carts with a repriced product need a new total
+                invalidate_cart_summaries(Product.objects.filter(slug__in=updated))
+        self.stats.updated += len(updated)
+        self.stats.created += len(products) - len(updated)
+
+    def _fetch(self, session, item):
+        name, (url, _) = item
+        if url is None:
+            return name, name if default_storage.exists(name) else None
+        try:
+            return name, fetch_image(session, url, name)
+        except (requests.RequestException, OSError, ValueError) as e:
+            logger.warning('could not fetch %s: %s', url, e)
+            return name, None
+
+    def _process_images(self):
+        # this batch's images; downloads are I/O bound, threads are enough; stored names may differ
+        # from the planned ones
+        pending, self.pending = self.pending, {}
+        stored = {}
+        with requests.Session() as session, ThreadPoolExecutor(self.fetch_workers) as pool:
+            session.mount('https://', HTTPAdapter(pool_maxsize=self.fetch_workers))
+            session.mount('http://', HTTPAdapter(pool_maxsize=self.fetch_workers))
+            for name, saved_as in pool.map(lambda item: self._fetch(session, item), pending.items()):
+                if saved_as is None:
+                    self.stats.image_failures += 1
+                else:
+                    stored[saved_as] = pending[name][1]
+
+        # resizing is CPU bound, generate_many spreads it over processes
+        results = generate_many(stored, workers=self.derive_workers)
+        for chunk in _batched(results, self.batch_size):
+            with transaction.atomic():
+                for name, derivatives in chunk:
+                    if derivatives is None:
+                        self.stats.image_failures += 1
+                        continue
+                    Product.objects.filter(slug__in=stored[name]).update(
+                        image=name, image_derivatives=derivatives, updated=timezone.now()
+                    )
+                    self.stats.images += 1
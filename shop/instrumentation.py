@@ -0,0 +1,286 @@
+import hashlib
+import logging
+import random
+import re
+import threading
+from collections import Counter
+from contextlib import ExitStack
+from contextvars import ContextVar
+from functools import lru_cache
+from time import perf_counter
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+MAX_FINGERPRINTS = 500  # duplicate-query series kept, so a bad deploy cannot grow memory forever
+
+_current = ContextVar('shop_request_metrics', default=None)
+
+IN_LIST_RE = re.compile(r'\bIN \((?:%s, )*%s\)')
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'(?<![\w."])-?\d+(?:\.\d+)?\b')
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(sql):
+    """``sql`` with its values taken out, so every run of one ORM call looks the same.
+
+    Parameters are already placeholders; IN lists of any length and the few
+    literals Django inlines (LIMIT, OFFSET) are folded too.
+    """
+    sql = IN_LIST_RE.sub('IN (...)', sql)
+    sql = STRING_RE.sub('?', sql)
+    return NUMBER_RE.sub('?', sql)
+
+
+def fingerprint_id(fp):
+    return hashlib.sha1(fp.encode()).hexdigest()[:12]
+
+
+class RequestMetrics:
+    """What one sampled request did, filled in while it runs."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.total = 0.0
+        self.fingerprints = Counter()
+        self._rendering = 0
+
+    def execute(self, execute, sql, params, many, context):
+        # a connection.execute_wrapper, wrapped around every query of the request
+        if _current.get() is not self:
+            # async requests can share a thread and its connection, each counts only its own queries
+            return execute(sql, params, many, context)
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += perf_counter() - start
+            self.queries += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    def duplicates(self):
+        """``{fingerprint: runs}`` for statements run more than once, the N+1 suspects."""
+        return {fp: n for fp, n in self.fingerprints.items() if n > 1}
+
+    def repeated(self):
+        return sum(n - 1 for n in self.fingerprints.values())
+
+    def server_timing(self):
+        # db and tpl overlap: querysets evaluated while rendering count in both
+        return ', '.join([
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries, {self.repeated()} repeated"',
+            f'tpl;dur={self.template_time * 1000:.1f}',
+            f'total;dur={self.total * 1000:.1f}',
+        ])
+
+
+class Histogram:
+    """A Prometheus histogram with one series per view name."""
+
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self._series = {}  # view -> [count per bucket..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, view, value):
+        with self._lock:
+            series = self._series.setdefault(view, [0] * len(self.buckets) + [0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((view, list(values)) for view, values in self._series.items())
+        for view, values in series:
+            for bound, count in zip(self.buckets, values):
+                lines.append(f'{self.name}_bucket{{view="{view}",le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{view="{view}",le="+Inf"}} {values[-1]}')
+            lines.append(f'{self.name}_sum{{view="{view}"}} {values[-2]:.6f}')
+            lines.append(f'{self.name}_count{{view="{view}"}} {values[-1]}')
+        return lines
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+
+class Registry:
+    def __init__(self):
+        self.latency = Histogram('shop_request_duration_seconds', 'Time to the response, by view.', LATENCY_BUCKETS)
+        self.db_time = Histogram('shop_request_db_seconds', 'Time spent in SQL per request, by view.', LATENCY_BUCKETS)
+        self.template_time = Histogram(
+            'shop_request_template_seconds', 'Time spent rendering templates per request, by view.', LATENCY_BUCKETS
+        )
+        self.queries = Histogram('shop_request_queries', 'SQL statements per request, by view.', QUERY_BUCKETS)
+        self.duplicate_queries = Histogram(
+            'shop_request_duplicate_queries', 'Repeats of an already run statement per request, by view.', QUERY_BUCKETS
+        )
+        self._fingerprints = Counter()  # (view, fingerprint id) -> repeats
+        self._lock = threading.Lock()
+
+    def observe(self, view, metrics):
+        duplicates = metrics.duplicates()
+        self.latency.observe(view, metrics.total)
+        self.db_time.observe(view, metrics.db_time)
+        self.template_time.observe(view, metrics.template_time)
+        self.queries.observe(view, metrics.queries)
+        self.duplicate_queries.observe(view, metrics.repeated())
+        with self._lock:
+            for fp, n in duplicates.items():
+                key = view, fingerprint_id(fp)
+                if key in self._fingerprints or len(self._fingerprints) < MAX_FINGERPRINTS:
+                    self._fingerprints[key] += n - 1
+
+    def render(self):
+        lines = []
+        for histogram in (self.latency, self.db_time, self.template_time, self.queries, self.duplicate_queries):
+            lines.extend(histogram.render())
+        lines += [
+            '# HELP shop_duplicate_queries_total Repeated statements by view and fingerprint id (the SQL is logged).',
+            '# TYPE shop_duplicate_queries_total counter',
+        ]
+        with self._lock:
+            counts = sorted(self._fingerprints.items())
+        for (view, fp_id), count in counts:
+            lines.append(f'shop_duplicate_queries_total{{view="{view}",fingerprint="{fp_id}"}} {count}')
+        return lines
+
+    def reset(self):
+        for histogram in (self.latency, self.db_time, self.template_time, self.queries, self.duplicate_queries):
+            histogram.reset()
+        with self._lock:
+            self._fingerprints.clear()
+
+
+registry = Registry()
+
+
+def sample_rate():
+    return getattr(settings, 'REQUEST_METRICS_SAMPLE_RATE', 1.0)
+
+
+class RequestMetricsMiddleware:
+    """Query count, DB time, duplicate statements, render time and latency per URL name.
+
+    Only ``REQUEST_METRICS_SAMPLE_RATE`` of requests are measured. Results go
+    to the Prometheus histograms of ``registry`` and, with
+    ``REQUEST_METRICS_SERVER_TIMING``, to a Server-Timing header. A streaming
+    response is measured up to its first byte. Under ASGI it runs async, so
+    async views are not pushed back onto a thread.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def _sampled():
+        rate = sample_rate()
+        return rate >= 1 or (rate > 0 and random.random() < rate)
+
+    @staticmethod
+    def _wrap_connections(stack, metrics):
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(metrics.execute))
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self._sampled():
+            return self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = perf_counter()
+        try:
+            with ExitStack() as stack:
+                self._wrap_connections(stack, metrics)
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        metrics.total = perf_counter() - start
+        return self._report(request, response, metrics)
+
+    async def __acall__(self, request):
+        if not self._sampled():
+            return await self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = perf_counter()
+        stack = ExitStack()
+        try:
+            # connections are per thread: wrap the ones of the thread the async ORM
+            # and sync_to_async(render) run this request's queries in
+            await sync_to_async(self._wrap_connections)(stack, metrics)
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(stack.close)()
+        finally:
+            _current.reset(token)
+        metrics.total = perf_counter() - start
+        return self._report(request, response, metrics)
+
+    def _report(self, request, response, metrics):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unresolved'
+        registry.observe(view, metrics)
+        if metrics.repeated() >= getattr(settings, 'REQUEST_METRICS_DUPLICATE_WARNING', 5):
+            fp, n = metrics.fingerprints.most_common(1)[0]
+            logger.warning('%s ran %d queries, %d repeated; worst x%d [%s]: %s',
+                           view, metrics.queries, metrics.repeated(), n, fingerprint_id(fp), fp)
+        if getattr(settings, 'REQUEST_METRICS_SERVER_TIMING', True):
+            response['Server-Timing'] = metrics.server_timing()
+        return response
+
+
+class TimedTemplate:
+    """A backend template that adds its render time to the current request's metrics."""
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None or metrics._rendering:
+            # not sampled, or nested inside a render that is already timed
+            return self.template.render(context, request)
+        metrics._rendering += 1
+        start = perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            metrics.template_time += perf_counter() - start
+            metrics._rendering -= 1
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, with render times reported to RequestMetricsMiddleware."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
@@ -0,0 +1,105 @@
+from collections import Counter
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from .caching import bump_catalogue_version
+from .models import Order, Product
+
+
+class OutOfStock(Exception):
+    def __init__(self, products):
+        super().__init__(', '.join(p.name for p in products))
+        self.products = products
+
+
+def _quantities(order):
+    counts = Counter()
+    for product_id, quantity in order.items.values_list('product_id', 'quantity'):
+        counts[product_id] += quantity
+    return counts
+
+
+def _per_product(counts):
+    return Case(*[When(id=pid, then=Value(n)) for pid, n in counts.items()])
+
+
+def _stock_changed():
+    # update() sends no post_save, so catalogue_changed never sees stock moves; cached pages,
+    # product cards and the in_stock facet show stock, drop them once the new numbers are visible
+    transaction.on_commit(bump_catalogue_version)
+
+
+def reserve_stock(order):
+    """Take the order's quantities out of Product.stock, all or nothing.
+
+    One conditional UPDATE (``stock = stock - n WHERE stock >= n``) covers
+    every line, so two buyers can never both get the last unit. Raises
+    OutOfStock, and changes nothing, if any line cannot be covered.
+    Call inside the transaction that creates the order.
+    """
+    counts = _quantities(order)
+    with transaction.atomic():
+        if counts:
+            amount = _per_product(counts)
+            # stock is public in the API, so bump updated with it (see shop.api)
+            reserved = Product.objects.filter(id__in=counts, stock__gte=amount).update(
+                stock=F('stock') - amount, updated=timezone.now()
+            )
+            if reserved != len(counts):
+                short = [p for p in Product.objects.filter(id__in=counts) if p.stock < counts[p.id]]
+                raise OutOfStock(short)
+            _stock_changed()
+        minutes = getattr(settings, 'STOCK_RESERVATION_MINUTES', 30)
+        Order.objects.filter(pk=order.pk).update(
+            stock_status='reserved', reserved_until=timezone.now() + timedelta(minutes=minutes)
+        )
+
+
+def _transition(order, source, target):
+    # the conditional update makes each transition happen once, even with concurrent callbacks
+    return Order.objects.filter(pk=order.pk, stock_status__in=source).update(stock_status=target) == 1
+
+
+def commit_stock(order):
+    """Make the reservation final on payment. Idempotent."""
+    with transaction.atomic():
+        if _transition(order, ['reserved'], 'committed'):
+            return
+        if _transition(order, ['none', 'released'], 'committed'):
+            # nothing held (old order, or reservation expired): take what is left,
+            # the buyer has already paid
+            counts = _quantities(order)
+            if counts:
+                Product.objects.filter(id__in=counts).update(
+                    stock=Greatest(F('stock') - _per_product(counts), Value(0)), updated=timezone.now()
+                )
+                _stock_changed()
+
+
+def release_stock(order):
+    """Put reserved quantities back, on payment fail/cancel or timeout. Idempotent."""
+    with transaction.atomic():
+        if not _transition(order, ['reserved'], 'released'):
+            return False
+        counts = _quantities(order)
+        if counts:
+            Product.objects.filter(id__in=counts).update(
+                stock=F('stock') + _per_product(counts), updated=timezone.now()
+            )
+            _stock_changed()
+        return True
+
+
+def release_expired_reservations(now=None):
+    expired = Order.objects.filter(
+        paid=False, stock_status='reserved', reserved_until__lt=now or timezone.now()
+    )
+    released = 0
+    for order in expired.only('id'):
+        if release_stock(order):
+            Order.objects.filter(pk=order.pk, paid=False).update(status='canceled')
+            released += 1
+    return released
@@ -0,0 +1,59 @@
+import tempfile
+from pathlib import Path
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from shop.benchmarks import concurrency, data, runner
+from shop.benchmarks.flows import FlowError
+from shop.models import Product
+
+
+class Command(BaseCommand):
+    help = ('Send the same logged-in catalogue, cart and payment requests through one sync (WSGI) '
+            'and one async (ASGI) worker, with a slow stub gateway, and compare throughput')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--views', nargs='+', choices=concurrency.VIEWS, default=list(concurrency.VIEWS))
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=50, help='requests the async worker takes at once')
+        parser.add_argument('--gateway-delay', type=float, default=0.1, help='seconds the stub gateway takes')
+        parser.add_argument('--database', help='SQLite file to run against, seeded if empty (default: a throwaway one)')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', help='also save both summaries as JSON here')
+
+    def handle(self, *args, **options):
+        scratch = None
+        if not options['database']:
+            scratch = tempfile.NamedTemporaryFile(prefix='shop-bench-', suffix='.sqlite3', delete=False)
+            scratch.close()
+        runner.use_database(options['database'] or scratch.name)
+        call_command('migrate', verbosity=0, interactive=False)
+        try:
+            if not Product.objects.exists():
+                self.stdout.write(f"Seeded {data.seed(products=200, users=5, ratings=200, orders=50, seed=options['seed'])}")
+            result = concurrency.compare_workers(
+                options['views'], options['requests'], options['concurrency'], options['gateway_delay'], options['seed']
+            )
+        except FlowError as e:
+            raise CommandError(e)
+        finally:
+            if scratch is not None:
+                Path(scratch.name).unlink(missing_ok=True)
+
+        self.stdout.write(f"{'worker':<8} {'requests':>8} {'errors':>6} {'in flight':>9} {'per s':>8} "
+                          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        for mode, summary in result.items():
+            self.stdout.write(
+                f"{mode:<8} {summary['requests']:>8} {summary['errors']:>6} {summary['peak_in_flight']:>9} "
+                f"{summary['throughput'] or 0:>8.1f} {summary['p50_ms'] or 0:>8.2f} "
+                f"{summary['p95_ms'] or 0:>8.2f} {summary['p99_ms'] or 0:>8.2f}"
+            )
+            if summary['first_error']:
+                self.stderr.write(f"  {mode}: {summary['first_error']}")
+        if result['sync']['throughput']:
+            gain = result['async']['throughput'] / result['sync']['throughput']
+            self.stdout.write(self.style.SUCCESS(f'async worker: {gain:.1f}x the requests per second of the sync worker'))
+        if options['output']:
+            run = {**runner.describe(mode='concurrency', requests=options['requests'],
+                                     concurrency=options['concurrency'], gateway_delay=options['gateway_delay'],
+                                     views=options['views'], seed=options['seed']), **result}
+            self.stdout.write(f"saved {runner.save(run, options['output'])}")
@@ -0,0 +1,41 @@
+import tempfile
+from pathlib import Path
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from shop.benchmarks import contention, data
+
+
+class Command(BaseCommand):
+    help = ('Run concurrent storefront reads and cart writes against SQLite as it was configured '
+            'before (rollback journal, deferred transactions) and as ecomm.database tunes it')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8, help='reading threads')
+        parser.add_argument('--writers', type=int, default=4, help='cart_add threads')
+        parser.add_argument('--seconds', type=float, default=5.0, help='per profile')
+        parser.add_argument('--products', type=int, default=1000, help='rows to seed')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'profile':<8} {'op':<6} {'ops':>7} {'per s':>8} {'errors':>7} "
+                          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        results = {}
+        with tempfile.TemporaryDirectory(prefix='shop-contention-') as tmp:
+            for name in ('default', 'tuned'):
+                # a file per profile, the journal mode sticks to the file
+                contention.use_profile(contention.profiles(Path(tmp) / f'{name}.sqlite3')[name])
+                call_command('migrate', verbosity=0, interactive=False)
+                data.seed(products=options['products'], users=options['writers'], ratings=0, orders=0, seed=options['seed'])
+                results[name] = contention.run(options['readers'], options['writers'], options['seconds'], options['seed'])
+                for op, row in results[name].items():
+                    self.stdout.write(
+                        f"{name:<8} {op:<6} {row['ops']:>7} {row['throughput']:>8.1f} {row['errors']:>7} "
+                        f"{row['p50_ms'] or 0:>8.2f} {row['p95_ms'] or 0:>8.2f} {row['p99_ms'] or 0:>8.2f}"
+                    )
+        for op in ('read', 'write'):
+            before, after = results['default'][op], results['tuned'][op]
+            if before['throughput']:
+                self.stdout.write(self.style.SUCCESS(
+                    f"{op}s: {after['throughput'] / before['throughput']:.1f}x the throughput, "
+                    f"failed {before['errors']} -> {after['errors']}"
+                ))
@@ -0,0 +1,84 @@
+import itertools
+import random
+import sqlite3
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from shop.benchmarks.data import vocabulary
+
+
+class Command(BaseCommand):
+    help = 'Compare the old icontains LIKE scan with the FTS5 index on synthetic catalogues'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[10_000, 100_000, 1_000_000])
+        parser.add_argument('--queries', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        self.stdout.write(f"{'products':>10} {'like p50 ms':>12} {'fts p50 ms':>12} {'speedup':>8}")
+        for size in options['sizes']:
+            words = vocabulary(rng)
+            db = self.build(size, rng, words)
+            # searches are mostly prefixes of words that exist, like keystrokes in the search box
+            terms = [rng.choice(words)[:rng.randint(4, 8)] for _ in range(options['queries'])]
+            like = self.time(db, terms, self.like_query)
+            fts = self.time(db, terms, self.fts_query)
+            self.stdout.write(f'{size:>10} {like:>12.2f} {fts:>12.2f} {like / fts:>7.1f}x')
+            db.close()
+
+    def build(self, size, rng, words):
+        # same table shapes as shop_product, shop_category and shop_product_search, in memory
+        db = sqlite3.connect(':memory:')
+        db.executescript(
+            'CREATE TABLE shop_category (id INTEGER PRIMARY KEY, name TEXT);'
+            'CREATE TABLE shop_product (id INTEGER PRIMARY KEY, name TEXT, description TEXT, '
+            'category_id INTEGER, available BOOL, created INTEGER);'
+            'CREATE INDEX product_created ON shop_product (available, created DESC, id DESC);'
+            "CREATE VIRTUAL TABLE shop_product_search USING fts5(name, description, category, prefix='2 3');"
+        )
+        db.executemany('INSERT INTO shop_category VALUES (?, ?)', [(i, f'{words[i]} goods') for i in range(20)])
+        cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(words))))
+        sentence = lambda n: ' '.join(rng.choices(words, cum_weights=cum_weights, k=n))  # noqa: E731
+        db.executemany(
+            'INSERT INTO shop_product VALUES (?, ?, ?, ?, 1, ?)',
+            ((i, sentence(3), sentence(40), rng.randrange(20), i) for i in range(1, size + 1)),
+        )
+        db.execute(
+            'INSERT INTO shop_product_search (rowid, name, description, category) '
+            'SELECT p.id, p.name, p.description, c.name FROM shop_product p '
+            'JOIN shop_category c ON c.id = p.category_id'
+        )
+        return db
+
+    @staticmethod
+    def like_query(db, term):
+        # what product_list used to run: three leading-wildcard LIKEs, newest first
+        pattern = f'%{term}%'
+        return db.execute(
+            'SELECT p.id FROM shop_product p JOIN shop_category c ON c.id = p.category_id '
+            'WHERE p.available AND (p.name LIKE ? OR p.description LIKE ? OR c.name LIKE ?) '
+            'ORDER BY p.created DESC, p.id DESC LIMIT 25',
+            (pattern, pattern, pattern),
+        ).fetchall()
+
+    @staticmethod
+    def fts_query(db, term):
+        # what SQLiteFTS5Backend.filter() builds, ranked by bm25
+        return db.execute(
+            'SELECT p.id FROM shop_product p '
+            'INNER JOIN shop_product_search s ON s.rowid = p.id '
+            'WHERE p.available AND s.shop_product_search MATCH ? '
+            'ORDER BY -bm25(s.shop_product_search, 10.0, 1.0, 5.0) DESC, p.id DESC LIMIT 25',
+            (f'"{term}"*',),
+        ).fetchall()
+
+    @staticmethod
+    def time(db, terms, query):
+        samples = []
+        for term in terms:
+            start = time.perf_counter()
+            query(db, term)
+            samples.append((time.perf_counter() - start) * 1000)
+        return statistics.median(samples)
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from shop import exports
+from shop.models import OrderItem
+
+
+class Command(BaseCommand):
+    help = 'Stream order lines as CSV or JSONL, to a file or stdout, in constant memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(exports.FORMATS), default='csv')
+        parser.add_argument('--output', help='file to write (default: stdout)')
+        parser.add_argument('--paid', action='store_true', help='only paid orders')
+        parser.add_argument('--since', help='orders created on or after this date (YYYY-MM-DD)')
+        parser.add_argument('--until', help='orders created before this date (YYYY-MM-DD)')
+        parser.add_argument('--chunk-size', type=int, default=exports.CHUNK_SIZE)
+
+    def _date(self, value, option):
+        date = parse_date(value) if value else None
+        if value and date is None:
+            raise CommandError(f'{option} must be a date like 2024-01-31')
+        return date
+
+    def handle(self, *args, **options):
+        items = OrderItem.objects.all()
+        if options['paid']:
+            items = items.filter(order__paid=True)
+        if since := self._date(options['since'], '--since'):
+            items = items.filter(order__created__date__gte=since)
+        if until := self._date(options['until'], '--until'):
+            items = items.filter(order__created__date__lt=until)
+
+        rows = exports.order_item_rows(items, chunk_size=options['chunk_size'])
+        chunks = exports.buffered(exports.encode(rows, options['format']))
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as f:
+                f.writelines(chunks)
+            self.stderr.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+        else:
+            for chunk in chunks:
+                # rows end in their own newlines
+                self.stdout.write(chunk, ending='')
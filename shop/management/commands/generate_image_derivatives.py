@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from shop.caching import bump_catalogue_version
+from shop.images import generate_many
+from shop.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Create the resized WebP/JPEG copies of product images, in parallel'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help='worker processes (default: CPU count)')
+        parser.add_argument('--force', action='store_true', help='also redo products that already have derivatives')
+
+    def handle(self, *args, **options):
+        products = list(Product.objects.exclude(image='').only('id', 'image', 'image_derivatives'))
+        if not options['force']:
+            products = [p for p in products if p.image_derivatives.get('source') != p.image.name]
+        by_name = {}
+        for product in products:
+            by_name.setdefault(product.image.name, []).append(product)
+
+        changed, failed = [], 0
+        for name, derivatives in generate_many(by_name, workers=options['workers']):
+            if derivatives is None:
+                failed += 1
+                continue
+            for product in by_name[name]:
+                product.image_derivatives = derivatives
+                changed.append(product)
+        Product.objects.bulk_update(changed, ['image_derivatives'], batch_size=500)
+        if changed:
+            bump_catalogue_version()
+        self.stdout.write(self.style.SUCCESS(f'Derived images for {len(changed)} products, {failed} failed'))
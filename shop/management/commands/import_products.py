@@ -0,0 +1,44 @@
+import os
+from django.core.management.base import BaseCommand, CommandError
+from shop import importer
+
+
+class Command(BaseCommand):
+    help = 'Create or update products from a CSV or JSONL feed, keyed by slug, in batched upserts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='feed with name, category, price and optional slug, description, stock, available, image')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='default: from the file extension')
+        parser.add_argument('--batch-size', type=int, default=importer.BATCH_SIZE)
+        parser.add_argument('--fetch-workers', type=int, default=importer.FETCH_WORKERS, help='image download threads')
+        parser.add_argument('--workers', type=int, default=None, help='image resize processes (default: CPU count)')
+        parser.add_argument('--skip-images', action='store_true', help='leave product images as they are')
+
+    def progress(self, stats):
+        self.stdout.write(f'{stats.rows} rows, {stats.invalid} invalid, {stats.images} images '
+                          f'({stats.elapsed():.1f}s, {stats.rate():.0f} rows/s)')
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or os.path.splitext(options['path'])[1].lstrip('.').lower()
+        if fmt not in ('csv', 'jsonl'):
+            raise CommandError('Pass --format csv or jsonl for this file')
+        run = importer.ProductImporter(
+            batch_size=options['batch_size'], fetch_workers=options['fetch_workers'],
+            derive_workers=options['workers'], with_images=not options['skip_images'], progress=self.progress,
+        )
+        try:
+            f = open(options['path'], encoding='utf-8', newline='')
+        except OSError as e:
+            raise CommandError(e)
+        with f:
+            stats = run.run(importer.read_feed(f, fmt))
+
+        for number, message in stats.errors:
+            self.stderr.write(f'line {number}: {message}')
+        if stats.invalid > len(stats.errors):
+            self.stderr.write(f'... and {stats.invalid - len(stats.errors)} more invalid rows')
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {stats.rows - stats.invalid} of {stats.rows} rows: {stats.created} created, '
+            f'{stats.updated} updated, {stats.images} images, {stats.image_failures} image failures '
+            f'in {stats.elapsed():.1f}s ({stats.rate():.0f} rows/s)'
+        ))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, FloatField, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Cast, Coalesce
+from shop.caching import bump_catalogue_version
+from shop.models import Product, Rating
+
+
+class Command(BaseCommand):
+    help = 'Recompute Product.rating_count/rating_sum/rating_avg from the Rating table'
+
+    def handle(self, *args, **options):
+        ratings = Rating.objects.filter(product=OuterRef('pk')).order_by().values('product')
+        count = Subquery(ratings.annotate(c=Count('id')).values('c'), output_field=IntegerField())
+        total = Subquery(ratings.annotate(s=Sum('rating')).values('s'), output_field=IntegerField())
+        with transaction.atomic():
+            # one UPDATE for the whole catalogue instead of one per product
+            updated = Product.objects.update(
+                rating_count=Coalesce(count, 0),
+                rating_sum=Coalesce(total, 0),
+                rating_avg=Cast(total, FloatField()) / Cast(count, FloatField()),
+            )
+        bump_catalogue_version()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt rating aggregates for {updated} products'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from shop import recommendations
+from shop.caching import bump_catalogue_version
+
+
+class Command(BaseCommand):
+    help = 'Recompute the related products of every product from co-purchases, category and price (run from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=8, help='neighbours stored per product')
+
+    def handle(self, *args, **options):
+        stored = recommendations.rebuild_related(options['top'])
+        bump_catalogue_version()
+        scorer = 'numpy' if recommendations.np is not None else 'python'
+        self.stdout.write(self.style.SUCCESS(f'Stored {stored} related product links ({scorer} scorer)'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from shop.caching import bump_catalogue_version
+from shop.search import get_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the product full-text search index from the Product and Category tables'
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        if backend is None:
+            raise CommandError('No full-text search backend for this database')
+        with transaction.atomic():
+            backend.rebuild()
+        bump_catalogue_version()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt search index ({type(backend).__name__})'))
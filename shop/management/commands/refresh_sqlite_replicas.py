@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+from shop.replicas import refresh_sqlite_replica, replicas
+
+
+class Command(BaseCommand):
+    help = ('Copy the SQLite primary into every SQLite replica in DATABASE_REPLICA_URLS, '
+            'to try replica routing locally; run it again to let the replicas catch up')
+
+    def handle(self, *args, **options):
+        aliases = replicas()
+        if not aliases:
+            raise CommandError('No replicas configured, set DATABASE_REPLICA_URLS')
+        for alias in aliases:
+            try:
+                refresh_sqlite_replica(alias)
+            except ValueError as e:
+                raise CommandError(e)
+            self.stdout.write(self.style.SUCCESS(f'Refreshed {alias}'))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from shop.inventory import release_expired_reservations
+
+
+class Command(BaseCommand):
+    help = 'Return stock held by unpaid orders whose reservation has expired (run from cron)'
+
+    def handle(self, *args, **options):
+        released = release_expired_reservations()
+        self.stdout.write(self.style.SUCCESS(f'Released stock for {released} expired orders'))
@@ -0,0 +1,90 @@
+import json
+import tempfile
+import time
+from pathlib import Path
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from shop.benchmarks import data, runner
+from shop.benchmarks.flows import FLOWS, FlowError
+from shop.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Time the storefront flows through the test client or a multi-process HTTP driver and save the run as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=['client', 'http'], default='client')
+        parser.add_argument('--flows', nargs='+', choices=sorted(FLOWS), default=list(FLOWS))
+        parser.add_argument('--iterations', type=int, default=300, help='flows per visitor')
+        parser.add_argument('--workers', type=int, default=4, help='visitor processes in http mode')
+        parser.add_argument('--url', help='drive this server instead of one started here (http mode)')
+        parser.add_argument('--database', help='SQLite file to run against, seeded if empty '
+                                               '(default: a throwaway one, or the configured database with --url)')
+        parser.add_argument('--seed', type=int, default=1)
+        for name, default in (('categories', 10), ('products', 1000), ('users', 50), ('ratings', 2000), ('orders', 500)):
+            parser.add_argument(f'--{name}', type=int, default=default, help='rows to seed')
+        parser.add_argument('--output', help='where to save the run (default: benchmark-results/<time>-<mode>.json)')
+        parser.add_argument('--compare', metavar='BASELINE', help='a saved run to diff against, fails on regressions')
+        parser.add_argument('--threshold', type=float, default=0.10, help='allowed p95/throughput change for --compare')
+
+    def handle(self, *args, **options):
+        if options['url'] and options['mode'] != 'http':
+            raise CommandError('--url needs --mode http')
+        scratch = None
+        if options['database'] or not options['url']:
+            if not options['database']:
+                scratch = tempfile.NamedTemporaryFile(prefix='shop-bench-', suffix='.sqlite3', delete=False)
+                scratch.close()
+            runner.use_database(options['database'] or scratch.name)
+            call_command('migrate', verbosity=0, interactive=False)
+        try:
+            # only a database picked for the benchmark gets seeded, never the configured one
+            self.run(options, seed=scratch is not None or bool(options['database']))
+        except FlowError as e:
+            raise CommandError(e)
+        finally:
+            if scratch is not None:
+                Path(scratch.name).unlink(missing_ok=True)
+
+    def run(self, options, seed):
+        dataset = None
+        if seed and not Product.objects.exists():
+            started = time.perf_counter()
+            dataset = data.seed(
+                categories=options['categories'], products=options['products'], users=options['users'],
+                ratings=options['ratings'], orders=options['orders'], seed=options['seed'],
+            )
+            self.stdout.write(f'Seeded {dataset} in {time.perf_counter() - started:.1f}s')
+
+        if options['mode'] == 'client':
+            result = runner.run_client(options['flows'], options['iterations'], options['seed'])
+        else:
+            result = runner.run_http(
+                options['flows'], options['iterations'], options['workers'], options['seed'], options['url']
+            )
+        run = {
+            **runner.describe(mode=options['mode'], iterations=options['iterations'],
+                              workers=options['workers'] if options['mode'] == 'http' else 1,
+                              seed=options['seed'], dataset=dataset),
+            **result,
+        }
+
+        self.stdout.write(f"{'flow':<16} {'count':>6} {'errors':>6} {'per s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        for name, flow in run['flows'].items():
+            self.stdout.write(
+                f"{name:<16} {flow['count']:>6} {flow['errors']:>6} {flow['throughput'] or 0:>8.1f} "
+                f"{flow['p50_ms'] or 0:>8.2f} {flow['p95_ms'] or 0:>8.2f} {flow['p99_ms'] or 0:>8.2f}"
+            )
+            if flow['first_error']:
+                self.stderr.write(f"  {name}: {flow['first_error']}")
+        stamp = run['created'].replace(':', '').replace('-', '')[:15]
+        path = runner.save(run, options['output'] or Path('benchmark-results') / f"{stamp}-{options['mode']}.json")
+        self.stdout.write(self.style.SUCCESS(f"{run['throughput']} flows/s over {run['wall_seconds']}s, saved {path}"))
+
+        if options['compare']:
+            baseline = json.loads(Path(options['compare']).read_text())
+            lines, regressed = runner.compare(baseline, run, options['threshold'])
+            for line in lines:
+                self.stdout.write(line)
+            if regressed:
+                raise CommandError(f"Slower than {options['compare']} by more than {options['threshold']:.0%}")
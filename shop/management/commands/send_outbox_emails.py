@@ -0,0 +1,34 @@
+import time
+from django.core.management.base import BaseCommand
+from shop.outbox import logger, send_batch
+
+
+class Command(BaseCommand):
+    help = 'Send queued outbox emails in batches over one SMTP connection per batch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--loop', action='store_true', help='keep polling instead of exiting when the queue is empty')
+        parser.add_argument('--interval', type=float, default=5.0, help='seconds to sleep when the queue is empty')
+
+    def handle(self, *args, **options):
+        total_sent = total_failed = 0
+        while True:
+            try:
+                sent, failed = send_batch(options['batch_size'])
+            except Exception:
+                if not options['loop']:
+                    raise
+                # e.g. the database restarting; claimed rows are picked up again when their lock expires
+                logger.exception('outbox batch failed, retrying in %ss', options['interval'])
+                time.sleep(options['interval'])
+                continue
+            total_sent += sent
+            total_failed += failed
+            if sent or failed:
+                self.stdout.write(f'sent {sent}, failed {failed}')
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS(f'Done: {total_sent} sent, {total_failed} failed'))
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:40
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def fill_rating_aggregates(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    Rating = apps.get_model('shop', 'Rating')
+    rows = Rating.objects.values('product').annotate(c=Count('id'), s=Sum('rating'))
+    for row in rows:
+        Product.objects.filter(pk=row['product']).update(
+            rating_count=row['c'], rating_sum=row['s'], rating_avg=row['s'] / row['c'],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0003_alter_category_slug_alter_order_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_avg',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0004_product_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['available', '-created', '-id'], name='product_avail_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['available', 'price', 'id'], name='product_avail_price_id_idx'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+SQLITE_CREATE = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS shop_product_search USING fts5("
+    "name, description, category, prefix='2 3', tokenize='unicode61 remove_diacritics 2')",
+    "INSERT INTO shop_product_search (rowid, name, description, category) "
+    "SELECT p.id, p.name, p.description, c.name FROM shop_product p "
+    "INNER JOIN shop_category c ON c.id = p.category_id",
+]
+SQLITE_DROP = ["DROP TABLE IF EXISTS shop_product_search"]
+
+POSTGRES_CREATE = [
+    "CREATE TABLE IF NOT EXISTS shop_product_search ("
+    "rowid bigint PRIMARY KEY REFERENCES shop_product (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+    "document tsvector NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS shop_product_search_document_idx ON shop_product_search USING GIN (document)",
+    "INSERT INTO shop_product_search (rowid, document) "
+    "SELECT p.id, setweight(to_tsvector('english', p.name), 'A') "
+    "|| setweight(to_tsvector('english', c.name), 'B') "
+    "|| setweight(to_tsvector('english', p.description), 'D') "
+    "FROM shop_product p INNER JOIN shop_category c ON c.id = p.category_id",
+]
+POSTGRES_DROP = ["DROP TABLE IF EXISTS shop_product_search"]
+
+STATEMENTS = {
+    'sqlite': (SQLITE_CREATE, SQLITE_DROP),
+    'postgresql': (POSTGRES_CREATE, POSTGRES_DROP),
+}
+
+
+def run(index):
+    def operation(apps, schema_editor):
+        statements = STATEMENTS.get(schema_editor.connection.vendor)
+        if statements is None:
+            return
+        for sql in statements[index]:
+            schema_editor.execute(sql)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0005_product_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchEntry',
+            fields=[
+                ('product', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_entry', serialize=False, to='shop.product')),
+            ],
+            options={
+                'db_table': 'shop_product_search',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(run(0), run(1)),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0006_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='reserved_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='stock_status',
+            field=models.CharField(choices=[('none', 'Not reserved'), ('reserved', 'Reserved'), ('committed', 'Committed'), ('released', 'Released')], default='none', max_length=10),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:59
+
+from django.db import migrations, models
+from django.db.models import DecimalField, F, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_order_totals(apps, schema_editor):
+    Order = apps.get_model('shop', 'Order')
+    OrderItem = apps.get_model('shop', 'OrderItem')
+    lines = OrderItem.objects.filter(order=OuterRef('pk')).order_by().values('order')
+    money = DecimalField(max_digits=12, decimal_places=2)
+    Order.objects.update(
+        subtotal=Coalesce(Subquery(lines.annotate(s=Sum(F('price') * F('quantity'), output_field=money)).values('s'), output_field=money), 0, output_field=money),
+        item_count=Coalesce(Subquery(lines.annotate(c=Sum('quantity')).values('c'), output_field=IntegerField()), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0008_outbox_email'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(fill_order_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 13:12
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_lines(apps, schema_editor):
+    # concurrent adds could create two lines for one product, fold them into the oldest
+    CartItem = apps.get_model('shop', 'CartItem')
+    duplicates = (
+        CartItem.objects.values('cart', 'product')
+        .annotate(n=Count('id'), keep=Min('id'), total=Sum('quantity'))
+        .filter(n__gt=1)
+    )
+    for row in duplicates:
+        CartItem.objects.filter(pk=row['keep']).update(quantity=row['total'])
+        CartItem.objects.filter(cart=row['cart'], product=row['product']).exclude(pk=row['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0012_related_product'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_lines, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('cart', 'product'), name='cartitem_cart_product_uniq'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 13:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0013_cartitem_unique_product'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rating',
+            name='updated',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
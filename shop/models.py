@@ -2,6 +2,10 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils.text import slugify
+from django.db.models import F, Q, Case, When, Value, Avg, Count, Sum
+from django.db.models.functions import Cast, Coalesce
+from decimal import Decimal
+from django.utils import timezone
 
 # Create your models here.
 class Category(models.Model):
@@ -18,6 +22,24 @@ class Category(models.Model):
         return self.name
     
 
+class ProductQuerySet(models.QuerySet):
+    def available(self):
+        return self.filter(available=True)
+
+    def for_listing(self):
+        # product cards touch category and the rating columns, nothing else
+        return self.available().select_related('category')
+
+    def for_detail(self):
+        return self.available().select_related('category').prefetch_related(
+            models.Prefetch('ratings', queryset=Rating.objects.select_related('user').order_by('-created'))
+        )
+
+    def with_live_ratings(self):
+        # computed from the Rating table, for checking the stored rating_* columns
+        return self.annotate(live_rating_avg=Avg('ratings__rating'), live_rating_count=Count('ratings'))
+
+
 class Product(models.Model):
     name = models.CharField(max_length=200)
     slug = models.SlugField(max_length=200,unique=True)
@@ -29,27 +51,105 @@ class Product(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
     image = models.ImageField(upload_to = 'products/%Y/%m/%d')
+    # denormalized from Rating, kept in sync by shop.signals
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_avg = models.FloatField(null=True, blank=True, editable=False)
+    # resized copies of image, see shop.images: {'source', 'digest', 'widths'}
+    image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
+
+    objects = ProductQuerySet.as_manager()
+
+    class Meta:
+        # Partial on available=True: the catalogue only ever lists available products,
+        # and SQLite cannot use a leading `available` column for Django's bare
+        # `WHERE "available"` filter. Orderings match PRODUCT_SORTS for keyset pagination.
+        indexes = [
+            models.Index(fields=['-created', '-id'], condition=Q(available=True), name='product_avail_created_idx'),
+            models.Index(fields=['price', 'id'], condition=Q(available=True), name='product_avail_price_idx'),
+            models.Index(
+                fields=['category', '-created', '-id'], condition=Q(available=True), name='product_avail_cat_created_idx'
+            ),
+            models.Index(fields=['category', 'price', 'id'], condition=Q(available=True), name='product_avail_cat_price_idx'),
+        ]
 
     def __str__(self):
         return self.name
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember the stored price, carts' badge totals only move when it does
+        instance._saved_price = instance.__dict__.get('price')
+        return instance
     
     def average_rating(self):
-        ratings = self.ratings.all()
-        if ratings.count()>0:
-            return sum([rating.rating for rating in ratings])/ratings.count()
+        if self.rating_count>0:
+            return self.rating_avg
     
+    @classmethod
+    def apply_rating_delta(cls, product_id, count_delta, sum_delta):
+        # single UPDATE, the right hand side sees the old column values;
+        # updated moves too, the API's ETag/Last-Modified are built from it
+        new_count = F('rating_count') + count_delta
+        new_sum = F('rating_sum') + sum_delta
+        return cls.objects.filter(pk=product_id).update(
+            updated=timezone.now(),
+            rating_count=new_count,
+            rating_sum=new_sum,
+            rating_avg=Case(
+                When(Q(rating_count__lte=-count_delta), then=Value(None)),
+                default=Cast(new_sum, models.FloatField()) / new_count,
+                output_field=models.FloatField(),
+            ),
+        )
+    
+class ProductSearchEntry(models.Model):
+    # full-text index row, the table is created per database vendor by migration 0006, see shop.search
+    product = models.OneToOneField(
+        Product, primary_key=True, db_column='rowid', db_constraint=False,
+        on_delete=models.DO_NOTHING, related_name='search_entry',
+    )
+
+    class Meta:
+        managed = False
+        db_table = 'shop_product_search'
+
+
+class RelatedProduct(models.Model):
+    # precomputed neighbours for product_detail, rebuilt by rebuild_related_products, see shop.recommendations
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='recommended_in')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            # also the index behind related_products(): product_id = ? ORDER BY rank
+            models.UniqueConstraint(fields=['product', 'rank'], name='relatedproduct_product_rank_uniq'),
+        ]
+
+
 class Rating(models.Model):
     product = models.ForeignKey(Product,on_delete=models.CASCADE, related_name='ratings')#product delete hoiye gele ratin gulo delete hoiye jabe
     user = models.ForeignKey(User,on_delete=models.CASCADE)
     rating = models.PositiveSmallIntegerField(validators = [MinValueValidator(1),MaxValueValidator(5)])
     comment = models.TextField()
     created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ('product','user')
 
     def __str__(self):
         return f'{self.product.name} - {self.rating}'
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember what is already counted in Product.rating_* for edits
+        instance._counted = (instance.__dict__.get('product_id'), instance.__dict__.get('rating'))
+        return instance
     
 
 class Cart(models.Model):
@@ -61,12 +161,20 @@ class Cart(models.Model):
         return f'Cart for {self.user.username}'
     
     def get_total_price(self):
-        items = self.items.all() # specific cart items
-        return sum(item.get_cost() for item in items)
+        return self.items.totals()['total']
     
     def get_total_items(self):
-        qty = self.items.all()
-        return sum(qty.quantity for qty in qty)
+        return self.items.totals()['items']
+
+
+class CartItemQuerySet(models.QuerySet):
+    def totals(self):
+        # item count and price in one aggregate, without loading lines or products
+        money = models.DecimalField(max_digits=12, decimal_places=2)
+        return self.aggregate(
+            items=Coalesce(Sum('quantity'), 0),
+            total=Coalesce(Sum(F('quantity') * F('product__price'), output_field=money), Decimal('0'), output_field=money),
+        )
 
 
 class CartItem(models.Model):
@@ -74,6 +182,14 @@ class CartItem(models.Model):
     product = models.ForeignKey(Product,on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
 
+    objects = CartItemQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # one line per product, lets the guest cart merge as an upsert
+            models.UniqueConstraint(fields=['cart', 'product'], name='cartitem_cart_product_uniq'),
+        ]
+
     def __str__(self):
         return f'{self.quantity} X {self.product.name}'
     
@@ -99,17 +215,47 @@ class Order(models.Model):
     note = models.TextField()
     paid = models.BooleanField(default = False)
     transaction_id = models.CharField(max_length=200,blank=True)
+    # stock held for this order, see shop.inventory
+    STOCK_STATUS_CHOICES = [
+        ('none','Not reserved'),
+        ('reserved','Reserved'),
+        ('committed','Committed'),
+        ('released','Released'),
+    ]
+    stock_status = models.CharField(max_length=10,choices=STOCK_STATUS_CHOICES,default='none')
+    reserved_until = models.DateTimeField(null=True,blank=True)
+    # set once from the order lines when the order is placed, see update_totals()
+    subtotal = models.DecimalField(max_digits=12,decimal_places=2,default=0)
+    item_count = models.PositiveIntegerField(default=0)
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created']
+        indexes = [
+            # profile order history, newest first
+            models.Index(fields=['user', '-created', '-id'], name='order_user_created_idx'),
+            # rate_product: did this user pay for an order
+            models.Index(fields=['user'], condition=Q(paid=True), name='order_user_paid_idx'),
+            # release_expired_reservations
+            models.Index(fields=['reserved_until'], condition=Q(stock_status='reserved'), name='order_reserved_until_idx'),
+        ]
 
     def __str__(self):
         return f'Order #{self.id}'
     
     def get_total_cost(self):
-        return sum(item.get_cost() for item in self.items.all())
+        return self.subtotal
+
+    def update_totals(self):
+        # recompute subtotal/item_count from the lines, e.g. after editing them in the admin
+        money = models.DecimalField(max_digits=12, decimal_places=2)
+        totals = self.items.aggregate(
+            subtotal=Coalesce(Sum(F('price') * F('quantity'), output_field=money), Decimal('0'), output_field=money),
+            item_count=Coalesce(Sum('quantity'), 0),
+        )
+        Order.objects.filter(pk=self.pk).update(**totals)
+        self.subtotal, self.item_count = totals['subtotal'], totals['item_count']
     
 
 class OrderItem(models.Model):
@@ -125,18 +271,28 @@ class OrderItem(models.Model):
         return self.price*self.quantity
 
 
-    
-
- 
-
-
-
-
-
-    
-
-
-
-
+class OutboxEmail(models.Model):
+    # emails queued by request handlers and sent by the send_outbox_emails worker, see shop.outbox
+    STATUS_CHOICES = [
+        ('pending','Pending'),
+        ('sending','Sending'),
+        ('sent','Sent'),
+        ('dead','Dead letter'),
+    ]
+    kind = models.CharField(max_length=50)
+    order = models.ForeignKey(Order,on_delete=models.CASCADE,null=True,blank=True,related_name='emails')
+    status = models.CharField(max_length=10,choices=STATUS_CHOICES,default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    available_at = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True,blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True,blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='outbox_status_available_idx'),
+        ]
 
+    def __str__(self):
+        return f'{self.kind} #{self.id} ({self.status})'
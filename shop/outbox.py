@@ -0,0 +1,89 @@
+import logging
+from datetime import timedelta
+from django.core.mail import get_connection
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import OutboxEmail
+from .utils import build_order_confirmation_email
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+LOCK_TIMEOUT = timedelta(minutes=5)
+
+# kind -> function(outbox row) returning an EmailMessage, rendered by the worker
+BUILDERS = {
+    'order_confirmation': lambda row: build_order_confirmation_email(row.order),
+}
+
+
+def enqueue(kind, order=None):
+    """Queue an email. This is all a request handler does, one INSERT."""
+    return OutboxEmail.objects.create(kind=kind, order=order)
+
+
+def retry_delay(attempts):
+    # 1, 2, 4, 8 ... minutes
+    return timedelta(minutes=2 ** (attempts - 1))
+
+
+def claim_batch(size, now=None):
+    """Lock up to ``size`` due rows for this worker.
+
+    Rows are claimed with a conditional UPDATE, so two workers never send
+    the same email; a claim left by a crashed worker expires after
+    LOCK_TIMEOUT and the row is picked up again.
+    """
+    now = now or timezone.now()
+    due = Q(status='pending', available_at__lte=now) | Q(status='sending', locked_until__lt=now)
+    ids = list(OutboxEmail.objects.filter(due).order_by('id').values_list('id', flat=True)[:size])
+    if not ids:
+        return []
+    lock = now + LOCK_TIMEOUT
+    OutboxEmail.objects.filter(Q(id__in=ids) & due).update(status='sending', locked_until=lock)
+    return list(OutboxEmail.objects.filter(id__in=ids, status='sending', locked_until=lock).select_related('order'))
+
+
+def send_batch(size=50, now=None):
+    """Send one batch over a single SMTP connection. Returns (sent, failed)."""
+    rows = claim_batch(size, now)
+    if not rows:
+        return 0, 0
+    sent, failed = [], []
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        # SMTP down or refusing our login: every claimed row failed an attempt, so an outage
+        # backs off and dead-letters like any other error instead of looping on expired claims
+        logger.warning('outbox could not connect, %s emails failed: %s', len(rows), e)
+        failed = [(row, e) for row in rows]
+    else:
+        try:
+            for row in rows:
+                try:
+                    message = BUILDERS[row.kind](row)
+                    message.connection = connection
+                    connection.send_messages([message])
+                    sent.append(row.id)
+                except Exception as e:
+                    logger.warning('outbox email %s failed: %s', row.id, e)
+                    failed.append((row, e))
+        finally:
+            connection.close()
+
+    now = timezone.now()
+    with transaction.atomic():
+        OutboxEmail.objects.filter(id__in=sent).update(status='sent', sent_at=now, locked_until=None)
+        for row, error in failed:
+            attempts = row.attempts + 1
+            if attempts >= MAX_ATTEMPTS:
+                changes = {'status': 'dead'}
+                logger.error('outbox email %s dead-lettered after %s attempts', row.id, attempts)
+            else:
+                changes = {'status': 'pending', 'available_at': now + retry_delay(attempts)}
+            OutboxEmail.objects.filter(id=row.id).update(
+                attempts=attempts, last_error=str(error)[:2000], locked_until=None, **changes
+            )
+    return len(sent), len(failed)
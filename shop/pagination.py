@@ -0,0 +1,141 @@
+import base64
+import json
+from types import SimpleNamespace
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def cursor_url(request, cursor):
+    """The current URL with ``cursor`` swapped in, keeping the other filters."""
+    if cursor is None:
+        return None
+    params = request.GET.copy()
+    params['cursor'] = cursor
+    return f'{request.path}?{params.urlencode()}'
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+
+class KeysetPaginator:
+    """Cursor pagination on (field, id).
+
+    Every page is one indexed range query of ``per_page + 1`` rows, so
+    page 1,000 costs the same as page 1. Cursors are opaque url-safe
+    tokens holding the boundary row's key and the direction.
+    """
+
+    def __init__(self, queryset, ordering, per_page=24):
+        self.queryset = queryset
+        self.ordering = ordering  # e.g. ('-created', '-id')
+        self.per_page = per_page
+
+    def page(self, cursor=None):
+        query, direction = self._query(cursor)
+        return self._page(list(query), direction)
+
+    async def apage(self, cursor=None):
+        query, direction = self._query(cursor)
+        return self._page([row async for row in query], direction)
+
+    def _query(self, cursor):
+        # the slice to fetch and the direction it walks, None for the first page
+        if not cursor:
+            return self.queryset.order_by(*self.ordering)[:self.per_page + 1], None
+        direction, key = self.decode(cursor)
+        if direction == 'n':
+            ordering = self.ordering
+        else:
+            # walk backwards from the first row of the page we came from
+            ordering = [self._flip(f) for f in self.ordering]
+        return self.queryset.filter(self._after(ordering, key)).order_by(*ordering)[:self.per_page + 1], direction
+
+    def _page(self, rows, direction):
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction is None:
+            return KeysetPage(rows, self._cursor(rows[-1], 'n') if more else None, None)
+        if direction == 'n':
+            next_cursor = self._cursor(rows[-1], 'n') if more and rows else None
+            previous_cursor = self._cursor(rows[0], 'p') if rows else None
+        else:
+            rows.reverse()
+            next_cursor = self._cursor(rows[-1], 'n') if rows else None
+            previous_cursor = self._cursor(rows[0], 'p') if more and rows else None
+        return KeysetPage(rows, next_cursor, previous_cursor)
+
+    def _after(self, ordering, key):
+        # (a, b) > (x, y)  ==  a > x OR (a = x AND b > y), for any mix of asc/desc
+        condition = Q()
+        equal = {}
+        for field, value in zip(ordering, key):
+            name = field.lstrip('-')
+            op = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{op}': value})
+            equal[name] = value
+        return condition
+
+    @staticmethod
+    def _flip(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    def _fields(self):
+        # model fields are serialized through the field, annotations are stored as is
+        opts = self.queryset.model._meta
+        names = [f.lstrip('-') for f in self.ordering]
+        return [None if name in self.queryset.query.annotations else opts.get_field(name) for name in names]
+
+    def _parsers(self):
+        # what decode() checks each key value with; a cursor is user input, annotations included
+        annotations = self.queryset.query.annotations
+        names = [f.lstrip('-') for f in self.ordering]
+        return [
+            (field or annotations[name].output_field).to_python
+            for field, name in zip(self._fields(), names)
+        ]
+
+    def _cursor(self, obj, direction):
+        if isinstance(obj, dict):
+            # rows of a .values() queryset, the ordering fields must be among the values
+            obj = SimpleNamespace(**obj)
+        names = [f.lstrip('-') for f in self.ordering]
+        key = [
+            field.value_to_string(obj) if field else getattr(obj, name)
+            for field, name in zip(self._fields(), names)
+        ]
+        raw = json.dumps([direction, key], separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode(self, cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            direction, key = json.loads(raw)
+            parsers = self._parsers()
+            if direction not in ('n', 'p') or not isinstance(key, list) or len(key) != len(parsers):
+                raise InvalidCursor(cursor)
+            return direction, [parse(value) for parse, value in zip(parsers, key)]
+        except (ValueError, TypeError, ValidationError) as e:
+            raise InvalidCursor(cursor) from e
@@ -0,0 +1,172 @@
+import heapq
+import logging
+import math
+from collections import Counter, defaultdict
+from itertools import combinations
+from django.db import transaction
+from .models import OrderItem, Product, RelatedProduct
+
+try:
+    import numpy as np
+except ImportError:  # in requirements.txt; without it the pure Python scorer gives the same results, slowly
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# score = CO_PURCHASE * cosine(co-purchases) + SAME_CATEGORY + PRICE * price closeness
+CO_PURCHASE_WEIGHT = 1.0
+SAME_CATEGORY_WEIGHT = 0.3
+PRICE_WEIGHT = 0.2
+BLOCK_SIZE = 512  # the numpy scorer holds a few BLOCK_SIZE x BLOCK_SIZE float arrays at a time
+
+
+def related_products(product, limit=4):
+    """The stored neighbours of ``product``, best first, in one indexed query."""
+    return (
+        Product.objects.for_listing()
+        .filter(recommended_in__product=product)
+        .order_by('recommended_in__rank')[:limit]
+    )
+
+
+def _co_purchases():
+    """Orders per product and co-purchase counts per product pair, from paid orders."""
+    baskets = defaultdict(set)
+    for order_id, product_id in OrderItem.objects.filter(order__paid=True).values_list('order_id', 'product_id'):
+        baskets[order_id].add(product_id)
+    orders, pairs = Counter(), Counter()
+    for basket in baskets.values():
+        orders.update(basket)
+        for a, b in combinations(sorted(basket), 2):
+            pairs[a, b] += 1
+    return orders, pairs
+
+
+def _price_closeness(a, b):
+    # 1 for the same price, 0.5 for double or half
+    if a <= 0 or b <= 0:
+        return 0.0
+    return 1.0 / (1.0 + abs(math.log2(a / b)))
+
+
+def _score_python(products, orders, pairs, top):
+    by_category = defaultdict(list)
+    for p in products:
+        by_category[p[1]].append(p[0])
+    info = {p[0]: p for p in products}
+    bought_with = defaultdict(dict)
+    for (a, b), n in pairs.items():
+        if a in info and b in info:
+            co = n / math.sqrt(orders[a] * orders[b])
+            bought_with[a][b] = co
+            bought_with[b][a] = co
+    result = {}
+    for pid, category, price in products:
+        candidates = set(by_category[category]) | set(bought_with[pid])
+        candidates.discard(pid)
+        scored = []
+        for other in candidates:
+            score = (
+                CO_PURCHASE_WEIGHT * bought_with[pid].get(other, 0.0)
+                + SAME_CATEGORY_WEIGHT * (info[other][1] == category)
+                + PRICE_WEIGHT * _price_closeness(price, info[other][2])
+            )
+            scored.append((-score, other))
+        result[pid] = [(other, -neg) for neg, other in heapq.nsmallest(top, scored)]
+    return result
+
+
+def _best(scores, ids, top):
+    # the ``top`` best columns of each row: best score first, lower id first on ties, like the Python scorer
+    order = np.lexsort((ids, -scores), axis=-1)[:, :top]
+    return np.take_along_axis(scores, order, -1), np.take_along_axis(ids, order, -1)
+
+
+def _score_numpy(products, orders, pairs, top):
+    """The Python scorer's results, with each category scored in BLOCK_SIZE x BLOCK_SIZE tiles.
+
+    Only products of the same category or bought together can be related:
+    a row keeps its best ``top`` across the tiles of its category, then the
+    few cross-category co-purchases are merged in. Memory does not grow with
+    the size of a category.
+    """
+    ids = np.array([p[0] for p in products], dtype=np.int64)
+    categories = np.array([p[1] for p in products], dtype=np.int64)
+    prices = np.array([p[2] for p in products], dtype=np.float64)
+    index = {pid: i for i, pid in enumerate(ids.tolist())}
+    log_prices = np.log2(np.where(prices > 0, prices, 1.0))
+
+    def closeness(a, b):
+        value = 1.0 / (1.0 + np.abs(log_prices[a] - log_prices[b]))
+        value[(prices[a] <= 0) | (prices[b] <= 0)] = 0.0
+        return value
+
+    # co-purchase cosine as a symmetric sparse matrix in COO form
+    entries = [(index[a], index[b], n / math.sqrt(orders[a] * orders[b]))
+               for (a, b), n in pairs.items() if a in index and b in index]
+    rows = np.array([e[0] for e in entries] + [e[1] for e in entries], dtype=np.int64)
+    cols = np.array([e[1] for e in entries] + [e[0] for e in entries], dtype=np.int64)
+    vals = np.array([e[2] for e in entries] * 2, dtype=np.float64)
+    same = categories[rows] == categories[cols]
+
+    across = defaultdict(list)  # product index -> [(score, related id)] from other categories
+    scores = CO_PURCHASE_WEIGHT * vals[~same] + PRICE_WEIGHT * closeness(rows[~same], cols[~same])
+    for row, col, score in zip(rows[~same].tolist(), cols[~same].tolist(), scores.tolist()):
+        across[row].append((score, int(ids[col])))
+    rows, cols, vals = rows[same], cols[same], vals[same]
+
+    result = {}
+    for category in np.unique(categories):
+        members = np.flatnonzero(categories == category)
+        inside = categories[rows] == category
+        # co-purchases within the category, by position in members
+        co_rows, co_cols = np.searchsorted(members, rows[inside]), np.searchsorted(members, cols[inside])
+        co_vals = vals[inside]
+        for start in range(0, len(members), BLOCK_SIZE):
+            block = members[start:start + BLOCK_SIZE]
+            in_block = (co_rows >= start) & (co_rows < start + len(block))
+            best = np.empty((len(block), 0)), np.empty((len(block), 0), dtype=np.int64)
+            for col_start in range(0, len(members), BLOCK_SIZE):
+                columns = members[col_start:col_start + BLOCK_SIZE]
+                co = np.zeros((len(block), len(columns)))
+                tile = in_block & (co_cols >= col_start) & (co_cols < col_start + len(columns))
+                np.add.at(co, (co_rows[tile] - start, co_cols[tile] - col_start), co_vals[tile])
+                scores = (
+                    CO_PURCHASE_WEIGHT * co + SAME_CATEGORY_WEIGHT
+                    + PRICE_WEIGHT * closeness(block[:, None], columns[None, :])
+                )
+                scores[block[:, None] == columns[None, :]] = -np.inf
+                tile_ids = np.broadcast_to(ids[columns], scores.shape)
+                best = _best(np.hstack([best[0], scores]), np.hstack([best[1], tile_ids]), top)
+            for row, i in enumerate(block.tolist()):
+                candidates = [(score, other) for score, other in zip(*(a[row].tolist() for a in best))
+                              if score > -math.inf] + across[i]
+                result[int(ids[i])] = [(other, score) for score, other in heapq.nsmallest(
+                    top, candidates, key=lambda c: (-c[0], c[1]))]
+    return result
+
+
+def compute_related(top=8):
+    """``{product_id: [(related_id, score), ...]}`` for every available product."""
+    products = list(Product.objects.available().order_by('id').values_list('id', 'category_id', 'price'))
+    products = [(pid, category, float(price)) for pid, category, price in products]
+    if not products:
+        return {}
+    orders, pairs = _co_purchases()
+    if np is None:
+        logger.warning('numpy is not installed, scoring %s products in pure Python', len(products))
+        return _score_python(products, orders, pairs, top)
+    return _score_numpy(products, orders, pairs, top)
+
+
+def rebuild_related(top=8):
+    related = compute_related(top)
+    links = [
+        RelatedProduct(product_id=pid, related_id=other, rank=rank, score=score)
+        for pid, neighbours in related.items()
+        for rank, (other, score) in enumerate(neighbours)
+    ]
+    with transaction.atomic():
+        RelatedProduct.objects.all().delete()
+        RelatedProduct.objects.bulk_create(links, batch_size=1000)
+    return len(links)
@@ -0,0 +1,150 @@
+import random
+import sqlite3
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = 'primary_pin'
+# read from the primary even in replica views: the visitor's own state, which a lagging
+# replica may not have yet and which the next write would be based on
+PRIMARY_READS = {'sessions.session', 'shop.cart', 'shop.cartitem'}
+
+_state = ContextVar('shop_replica_routing', default=None)
+
+
+def replicas():
+    return list(getattr(settings, 'DATABASE_REPLICAS', ()))
+
+
+def current_replica():
+    """The replica the current request has read from, None if it only read the primary."""
+    state = _state.get()
+    return state.replica if state is not None else None
+
+
+def replica_reads(view):
+    """Let ``view``'s reads go to a replica, unless its visitor wrote in the last ``REPLICA_PIN_SECONDS``.
+
+    For catalogue and profile pages, which may be a moment behind. Put it
+    above the other decorators, the router looks at the resolved view.
+    """
+    view.replica_reads = True
+    return view
+
+
+class RoutingState:
+    """Where the current request reads from, shared by the router and ReplicaPinMiddleware."""
+
+    def __init__(self, request, pinned):
+        self.request = request
+        self.pinned = pinned
+        self.wrote = False
+        self.replica = None
+
+    def replica_view(self):
+        # before URL resolution (middleware) there is no view yet, read from the primary
+        match = getattr(self.request, 'resolver_match', None)
+        return match is not None and getattr(match.func, 'replica_reads', False)
+
+
+class PrimaryReplicaRouter:
+    """Reads of ``@replica_reads`` views go to one of ``DATABASE_REPLICAS``, everything else to the primary.
+
+    A request that writes reads from the primary from then on, and
+    ReplicaPinMiddleware keeps its visitor there for the next requests too,
+    so nobody reads a replica that has not caught up with their own write.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.pinned or model._meta.label_lower in PRIMARY_READS:
+            return None
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # related objects come from where their instance came from
+            return instance._state.db
+        if not state.replica_view():
+            return None
+        if state.replica is None:
+            names = replicas()
+            if not names:
+                return None
+            # one replica per request, so all its reads see the same point in time
+            state.replica = random.choice(names)
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        # sessions and carts are read from the primary anyway, saving them pins nobody
+        if state is not None and model._meta.label_lower not in PRIMARY_READS:
+            state.wrote = state.pinned = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as the primary
+        databases = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas get their schema from the primary
+        if db in replicas():
+            return False
+        return None
+
+
+class ReplicaPinMiddleware:
+    """Sets up routing per request and pins visitors who just wrote to the primary with a short-lived cookie."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = RoutingState(request, pinned=PIN_COOKIE in request.COOKIES)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self._pin(state, response)
+
+    async def __acall__(self, request):
+        state = RoutingState(request, pinned=PIN_COOKIE in request.COOKIES)
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self._pin(state, response)
+
+    def _pin(self, state, response):
+        if state.wrote and replicas():
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=getattr(settings, 'REPLICA_PIN_SECONDS', 10), httponly=True, samesite='Lax'
+            )
+        return response
+
+
+def refresh_sqlite_replica(alias):
+    """Copy the primary SQLite database into replica ``alias`` with SQLite's online backup.
+
+    Replication for local testing: the copy is consistent even while the
+    primary is being written to.
+    """
+    source, target = connections[DEFAULT_DB_ALIAS], connections[alias]
+    if source.vendor != 'sqlite' or target.vendor != 'sqlite':
+        raise ValueError(f'{alias}: only SQLite replicas of a SQLite primary can be refreshed here')
+    target.close()
+    source.ensure_connection()
+    with sqlite3.connect(target.settings_dict['NAME']) as destination:
+        source.connection.backup(destination)
+    destination.close()
@@ -0,0 +1,135 @@
+import re
+from django.db import connection
+from django.db.models import BooleanField, Expression, F, FloatField, Q, Value
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(query):
+    return TOKEN_RE.findall(query.lower())[:16]
+
+
+class SearchSQL(Expression):
+    """Backend SQL about the joined search index row.
+
+    ``{table}`` in ``sql`` is replaced with the alias the ORM gave the
+    ``shop_product_search`` join, so it works however the queryset is built.
+    """
+
+    def __init__(self, sql, params, output_field):
+        super().__init__(output_field=output_field)
+        self.entry = F('search_entry__pk')
+        self.sql = sql
+        self.params = params
+
+    def get_source_expressions(self):
+        return [self.entry]
+
+    def set_source_expressions(self, exprs):
+        self.entry, = exprs
+
+    def as_sql(self, compiler, connection):
+        table = compiler.quote_name_unless_alias(self.entry.alias)
+        return self.sql.format(table=table), list(self.params)
+
+
+class SearchBackend:
+    """Full-text index over product name, description and category name.
+
+    The index is the ``shop_product_search`` side table (ProductSearchEntry,
+    created by migration 0006) keyed by product id, so the Product table itself
+    is untouched. Backends only differ in the SQL they emit.
+    """
+
+    def filter(self, queryset, query):
+        """Restrict ``queryset`` to matches and annotate ``search_rank`` (higher is better)."""
+        terms = tokenize(query)
+        if not terms:
+            return queryset.annotate(search_rank=Value(0.0, output_field=FloatField())).none()
+        expression = self.expression(terms)
+        # isnull=False makes the join INNER, which lets the index drive the query
+        return queryset.filter(
+            SearchSQL(self.match_sql, [expression], BooleanField()), search_entry__isnull=False
+        ).annotate(
+            search_rank=SearchSQL(self.rank_sql, [expression] * self.rank_sql.count('%s'), FloatField())
+        )
+
+    def index_products(self, ids):
+        if ids:
+            self.reindex('p.id IN (%s)' % ', '.join(['%s'] * len(ids)), list(ids))
+
+    def index_category(self, category_id):
+        self.reindex('p.category_id = %s', [category_id])
+
+    def rebuild(self):
+        self.reindex('1 = 1', [])
+
+    def remove_products(self, ids):
+        if ids:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'DELETE FROM shop_product_search WHERE rowid IN (%s)' % ', '.join(['%s'] * len(ids)),
+                    list(ids),
+                )
+
+    def reindex(self, where, params):
+        # delete + INSERT ... SELECT keeps it at two statements for any number of rows
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'DELETE FROM shop_product_search WHERE rowid IN (SELECT p.id FROM shop_product p WHERE %s)' % where,
+                params,
+            )
+            cursor.execute(self.insert_sql % where, params)
+
+
+class SQLiteFTS5Backend(SearchBackend):
+    insert_sql = (
+        'INSERT INTO shop_product_search (rowid, name, description, category) '
+        'SELECT p.id, p.name, p.description, c.name FROM shop_product p '
+        'INNER JOIN shop_category c ON c.id = p.category_id WHERE %s'
+    )
+    # an FTS5 table has a hidden column named after itself, used for MATCH and bm25;
+    # bm25 column weights are name, description, category
+    match_sql = '{table}."shop_product_search" MATCH %s'
+    rank_sql = '-bm25({table}."shop_product_search", 10.0, 1.0, 5.0)'
+
+    def expression(self, terms):
+        # every term is a quoted prefix query, so user input cannot inject FTS syntax
+        return ' '.join(f'"{term}"*' for term in terms)
+
+
+class PostgresBackend(SearchBackend):
+    insert_sql = (
+        'INSERT INTO shop_product_search (rowid, document) '
+        "SELECT p.id, setweight(to_tsvector('english', p.name), 'A') "
+        "|| setweight(to_tsvector('english', c.name), 'B') "
+        "|| setweight(to_tsvector('english', p.description), 'D') "
+        'FROM shop_product p INNER JOIN shop_category c ON c.id = p.category_id WHERE %s'
+    )
+    match_sql = "{table}.document @@ to_tsquery('english', %s)"
+    # PostgreSQL has no BM25; ts_rank_cd over the weighted vector is the closest built-in
+    rank_sql = "ts_rank_cd({table}.document, to_tsquery('english', %s))"
+
+    def expression(self, terms):
+        return ' & '.join(f'{term}:*' for term in terms)
+
+
+BACKENDS = {
+    'sqlite': SQLiteFTS5Backend,
+    'postgresql': PostgresBackend,
+}
+
+
+def get_backend():
+    backend = BACKENDS.get(connection.vendor)
+    return backend() if backend else None
+
+
+def search_products(queryset, query):
+    backend = get_backend()
+    if backend is not None:
+        return backend.filter(queryset, query)
+    # no full-text index on this database, fall back to the LIKE scan
+    return queryset.filter(
+        Q(name__icontains=query) | Q(description__icontains=query) | Q(category__name__icontains=query)
+    ).annotate(search_rank=Value(0.0, output_field=FloatField()))
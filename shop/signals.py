@@ -0,0 +1,99 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+from .caching import bump_catalogue_version
+from .cart import invalidate_cart_summaries
+from .images import generate_many
+from .models import Category, Product, Rating
+from .search import get_backend
+
+
+@receiver(post_save, sender=Rating)
+def rating_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    old_product_id, old_rating = getattr(instance, '_counted', (None, None))
+    with transaction.atomic():
+        if old_product_id is None:
+            Product.apply_rating_delta(instance.product_id, 1, instance.rating)
+        elif old_product_id != instance.product_id:
+            Product.apply_rating_delta(old_product_id, -1, -old_rating)
+            Product.apply_rating_delta(instance.product_id, 1, instance.rating)
+        elif old_rating != instance.rating:
+            Product.apply_rating_delta(instance.product_id, 0, instance.rating - old_rating)
+    instance._counted = (instance.product_id, instance.rating)
+
+
+@receiver(post_delete, sender=Rating)
+def rating_deleted(sender, instance, **kwargs):
+    old_product_id, old_rating = getattr(instance, '_counted', (instance.product_id, instance.rating))
+    if old_product_id is not None:
+        Product.apply_rating_delta(old_product_id, -1, -old_rating)
+    instance._counted = (None, None)
+
+
+def _price_changed(instance, created, update_fields):
+    # a new product is in no cart yet; instances not loaded from the db
+    # (or loaded without price) have no known old price, assume it moved
+    if created or (update_fields is not None and 'price' not in update_fields):
+        return False
+    to_python = Product._meta.get_field('price').to_python
+    return to_python(getattr(instance, '_saved_price', None)) != to_python(instance.price)
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    backend = get_backend()
+    if backend is not None and not raw:
+        backend.index_products([instance.pk])
+    if not raw and _price_changed(instance, created, update_fields):
+        # carts' badge totals were built from the old price
+        invalidate_cart_summaries([instance.pk])
+    if update_fields is None or 'price' in update_fields:
+        instance._saved_price = instance.price
+    if not raw and instance.image and instance.image_derivatives.get('source') != instance.image.name:
+        # resize after commit, the upload must not hold the transaction open
+        transaction.on_commit(lambda: derive_product_image(instance.pk, instance.image.name))
+
+
+def derive_product_image(product_id, name):
+    for name, derivatives in generate_many([name], workers=1):
+        if derivatives:
+            # update() skips the signals, a changed image name means a newer upload won
+            Product.objects.filter(pk=product_id, image=name).update(image_derivatives=derivatives)
+            bump_catalogue_version()
+
+
+@receiver(pre_delete, sender=Product)
+def product_deleting(sender, instance, **kwargs):
+    # before the cascade takes the cart lines that tell whose badges to drop
+    invalidate_cart_summaries([instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    backend = get_backend()
+    if backend is not None:
+        backend.remove_products([instance.pk])
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, created, raw=False, **kwargs):
+    # the category name is indexed with each of its products
+    backend = get_backend()
+    if backend is not None and not raw and not created:
+        backend.index_category(instance.pk)
+
+
+def catalogue_changed(sender, raw=False, **kwargs):
+    # covers admin edits too, list_editable saves each changed row through save().
+    # Bump now so this request reads its own writes, and again on commit so a page
+    # another request cached from the old rows meanwhile is dropped as well.
+    if not raw:
+        bump_catalogue_version()
+        transaction.on_commit(bump_catalogue_version)
+
+
+for model in (Category, Product, Rating):
+    post_save.connect(catalogue_changed, sender=model, dispatch_uid=f'catalogue_changed_save_{model.__name__}')
+    post_delete.connect(catalogue_changed, sender=model, dispatch_uid=f'catalogue_changed_delete_{model.__name__}')
@@ -0,0 +1,41 @@
+from django import template
+from django.core.cache import cache
+from ..caching import fragment_cache_key, refresh_csrf, replica_may_lag, stats, timeout
+
+register = template.Library()
+
+
+class CatalogueCacheNode(template.Node):
+    def __init__(self, nodelist, name, vary_on):
+        self.nodelist = nodelist
+        self.name = name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        key = fragment_cache_key(self.name.resolve(context), [v.resolve(context) for v in self.vary_on])
+        content = cache.get(key)
+        stats.record('fragment', content is not None)
+        if content is None:
+            content = self.nodelist.render(context)
+            if not replica_may_lag():
+                cache.set(key, content, timeout())
+        elif 'csrf_token' in context:
+            content = refresh_csrf(content, str(context['csrf_token']))
+        return content
+
+
+@register.tag
+def catalogue_cache(parser, token):
+    """Cache a template fragment until the catalogue changes.
+
+    {% catalogue_cache 'product_card' product.id %} ... {% endcatalogue_cache %}
+
+    Like ``{% cache %}`` but keyed on the catalogue version, so saving a
+    product, category or rating drops every fragment without a timeout guess.
+    """
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' needs a fragment name")
+    nodelist = parser.parse(('endcatalogue_cache',))
+    parser.delete_first_token()
+    return CatalogueCacheNode(nodelist, parser.compile_filter(bits[1]), [parser.compile_filter(b) for b in bits[2:]])
@@ -0,0 +1,36 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+from ..images import FORMATS, derivative_url
+
+register = template.Library()
+
+# card grids are 1 column on phones, 2 on tablets, 3-4 on desktop
+CARD_SIZES = '(min-width: 992px) 25vw, (min-width: 768px) 50vw, 100vw'
+
+
+@register.simple_tag
+def product_image(product, css_class='', sizes=CARD_SIZES, loading='lazy'):
+    """``<picture>`` with WebP and JPEG ``srcset``s for the product image.
+
+    Falls back to the original upload while the derivatives are missing or
+    belong to a previous image.
+    """
+    derivatives = product.image_derivatives or {}
+    if derivatives.get('source') != product.image.name:
+        return format_html(
+            '<img src="{}" class="{}" alt="{}" loading="{}">', product.image.url, css_class, product.name, loading
+        )
+    widths = derivatives['widths']
+
+    def srcset(fmt):
+        return ', '.join(f'{derivative_url(derivatives, width, fmt)} {width}w' for width in widths)
+
+    sources = format_html_join(
+        '', '<source type="image/{}" srcset="{}" sizes="{}">',
+        ((fmt, srcset(fmt), sizes) for fmt in FORMATS if fmt != 'jpeg'),
+    )
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" class="{}" alt="{}" loading="{}"></picture>',
+        sources, derivative_url(derivatives, widths[-1], 'jpeg'), srcset('jpeg'), sizes,
+        css_class, product.name, loading,
+    )
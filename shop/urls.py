@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.urls import path,include
-from .import views
+from .import api, views
 from django.conf import settings
 from django.conf.urls.static import static
 
@@ -29,7 +29,13 @@ urlpatterns = [
     path('payment/cancel/<int:order_id>/',views.payment_cancel,name='payment_cancel'),
 
     path('profile/',views.profile,name='profile'),
-    path('rate/<int:product_id>/',views.rate_product,name='rate_product') 
+    path('rate/<int:product_id>/',views.rate_product,name='rate_product'),
+    path('metrics/',views.metrics,name='metrics'),
+
+    path('api/products/',api.products,name='api_products'),
+    path('api/products/<slug:slug>/',api.product,name='api_product'),
+    path('api/products/<slug:slug>/ratings/',api.product_ratings,name='api_product_ratings'),
+    path('api/categories/',api.categories,name='api_categories'),
 
 
 ]
@@ -1,10 +1,16 @@
-import json
-import requests
 from django.conf import settings
+from .gateway import GatewayError, get_client
 from django.template.loader import render_to_string
 from django.core.mail import EmailMultiAlternatives
-def generate_sslcommerz_payment(order,request):
-    post_data = {
+async def aget_user(request):
+    # auser() and the lazy request.user cache apart; share one load with the
+    # templates and context processors, which still read request.user
+    request.user = await request.auser()
+    return request.user
+
+
+def sslcommerz_post_data(order,request):
+    return {
         'store_id': settings.SSLCOMMERZ_STORE_ID,
         'store_passwd': settings.SSLCOMMERZ_STORE_PASSWORD,
         'total_amount':float(order.get_total_cost()),
@@ -25,12 +31,24 @@ def generate_sslcommerz_payment(order,request):
         'product_profile':'general',
     }
 
-    response = requests.post(settings.SSLCOMMERZ_PAYMENT_URL, data=post_data)
-    return json.loads(response.text)
 
+def generate_sslcommerz_payment(order,request):
+    try:
+        return get_client().init_payment(sslcommerz_post_data(order, request))
+    except GatewayError as e:
+        # same shape as a gateway failure, payment_process shows the error message
+        return {'status': 'FAILED', 'failedreason': str(e)}
 
 
-def send_order_confirmation_email(order):
+async def agenerate_sslcommerz_payment(order,request):
+    try:
+        return await get_client().ainit_payment(sslcommerz_post_data(order, request))
+    except GatewayError as e:
+        return {'status': 'FAILED', 'failedreason': str(e)}
+
+
+
+def build_order_confirmation_email(order):
     subject = f'Order Confirmation - Order #{order.id}'
 
     # ✅ HTML template render
@@ -52,4 +70,8 @@ def send_order_confirmation_email(order):
 
     # ✅ HTML attach
     email.attach_alternative(message, 'text/html')
-    email.send()
\ No newline at end of file
+    return email
+
+
+def send_order_confirmation_email(order):
+    build_order_confirmation_email(order).send()
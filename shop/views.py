@@ -1,71 +1,107 @@
-from django.shortcuts import render,redirect,get_object_or_404
+from asgiref.sync import sync_to_async
+from django.shortcuts import render,redirect,get_object_or_404,aget_object_or_404
 from django.contrib.auth import login,authenticate,logout
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib import messages
-from django.db.models import Min, Max, Avg, Q
 from . import models
 from .forms import RegistrationForm, RatingForms, CheckoutForm
 from django.contrib.auth.decorators import login_required
-from .utils import generate_sslcommerz_payment, send_order_confirmation_email
+from .caching import cache_catalogue_page, stats as cache_stats
+from .instrumentation import registry as request_metrics
+from . import cart as carts
+from .cart import GuestCart, merge_guest_cart
+from .facets import ProductFilters, acompute_facets
+from .inventory import OutOfStock, commit_stock, release_stock
+from .orders import EmptyCart, place_order
+from .outbox import enqueue
+from .pagination import KeysetPaginator, InvalidCursor, cursor_url
+from .recommendations import related_products as related_products_for
+from .replicas import replica_reads
+from .search import search_products
+from .utils import agenerate_sslcommerz_payment, aget_user
 from django.views.decorators.csrf import csrf_exempt
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.conf import settings
+from django.utils import timezone
+from django.db.models import Count, Prefetch, Q, Sum
+from django.db.models.functions import Coalesce
+from decimal import Decimal
 # Create your views here.
 
-def home(request):
-    featured_products = models.Product.objects.filter(available=True).order_by('-created')[:8]
-    categories = models.Category.objects.all()
+async def _arender(request, template_name, context):
+    # context processors, the lazy user and messages use the sync ORM and session,
+    # so the template renders in the request's sync thread
+    return await sync_to_async(render)(request, template_name, context)
+
+@replica_reads
+@cache_catalogue_page
+async def home(request):
+    featured_products = [p async for p in models.Product.objects.for_listing().order_by('-created')[:8]]
+    categories = [c async for c in models.Category.objects.all()]
     context = {
         'featured_products':featured_products,
         'categories':categories,
     }
-    return render(request,'shop/home.html',context)
+    return await _arender(request,'shop/home.html',context)
+
+PRODUCTS_PER_PAGE = 24
+ORDERS_PER_PAGE = 10
+RELATED_PRODUCTS_SHOWN = 4
 
-def product_list(request,category_slug=None):
+@replica_reads
+@cache_catalogue_page
+async def product_list(request,category_slug=None):
     category = None
-    categories = models.Category.objects.all()
-    products = models.Product.objects.filter(available=True)
+    filters = ProductFilters(request.GET)
+    products = models.Product.objects.for_listing()
+    if filters.search:
+        products = search_products(products, filters.search)
 
     if category_slug:
-        category = get_object_or_404(models.Category,slug=category_slug)
+        category = await aget_object_or_404(models.Category,slug=category_slug)
+
+    # one grouped query for the whole sidebar: categories, price bounds, rating and stock counts
+    facets = await acompute_facets(products, filters, category)
+
+    if category:
         products = products.filter(category=category)
-    
-    min_price = products.aggregate(Min('price'))['price__min']
-    max_price = products.aggregate(Max('price'))['price__max']
-
-    if request.GET.get('min_price'):
-        products = products.filter(price__gte=request.GET.get('min_price'))
-    if request.GET.get('max_price'):
-        products = products.filter(price__lte=request.GET.get('max_price'))
-    if request.GET.get('rating'):
-        min_rating = request.GET.get('rating')
-        products = products.annotate(avg_rating=Avg('ratings__rating')).filter(avg_rating__gte=min_rating) #aitar kaj holo suppose user 4 rating er product dekhte chasse so aita return korbe (>=4) er rating
-
-    if request.GET.get('search'):
-        query = request.GET.get('search')
-        products = products.filter(
-            Q(name__icontains = query)|
-            Q(description__icontains = query)|
-            Q(category__name__icontains = query)
-        )
-    
+    products = products.filter(filters.q())
+
+    paginator = KeysetPaginator(products, filters.ordering(), per_page=PRODUCTS_PER_PAGE)
+    try:
+        page = await paginator.apage(request.GET.get('cursor'))
+    except InvalidCursor:
+        page = await paginator.apage()
+
     context = {
         'category':category,
-        'categories':categories,
-        'products':products,
-        'min_price':min_price,
-        'max_price':max_price,
+        'categories':facets.categories,
+        'facets':facets,
+        'products':page,
+        'page':page,
+        'sort':filters.sort,
+        'next_page_url':cursor_url(request, page.next_cursor),
+        'previous_page_url':cursor_url(request, page.previous_cursor),
+        'min_price':facets.min_price,
+        'max_price':facets.max_price,
     }
 
-    return render(request,'shop/product_list.html',context)
+    return await _arender(request,'shop/product_list.html',context)
 
-def product_detail(request,slug):
-    product = get_object_or_404(models.Product,slug=slug,available=True)
-    related_products = models.Product.objects.filter(category=product.category).exclude(id=product.id)
+@replica_reads
+@cache_catalogue_page
+async def product_detail(request,slug):
+    product = await aget_object_or_404(models.Product.objects.for_detail(),slug=slug)
+    # left lazy: the template only runs it when the related fragment is not cached
+    related_products = related_products_for(product, RELATED_PRODUCTS_SHOWN)
+    user = await aget_user(request)
     user_rating = None
-    if request.user.is_authenticated:
-        try:
-            user_rating = models.Rating.objects.get(product=product,user=request.user)
-        except models.Rating.DoesNotExist:
-            pass
+    if user.is_authenticated:
+        # ratings are already prefetched by for_detail()
+        for rating in product.ratings.all():
+            if rating.user_id == user.id:
+                user_rating = rating
+                break
     rating_form = RatingForms(instance=user_rating)
     context = {
         'product':product,
@@ -73,60 +109,72 @@ def product_detail(request,slug):
         'user_rating':user_rating,
         'rating_form':rating_form,
     }
-    return render(request,'shop/product_detail.html',context)
-
-@login_required
-def cart_detail(request):
-    try:
-        cart = models.Cart.objects.get(user=request.user)
-    except models.Cart.DoesNotExist:
-        cart = models.Cart.objects.create(user=request.user)
-    
-    return render(request,'shop/cart.html',{'cart':cart})
+    return await _arender(request,'shop/product_detail.html',context)
+
+async def _cart_page(request, items):
+    # totals from the loaded lines, not one aggregate per template lookup
+    return await _arender(request,'shop/cart.html',{
+        'cart_items':items,
+        'cart_total_items':sum(item.quantity for item in items),
+        'cart_total_price':sum((item.get_cost() for item in items), Decimal('0')),
+    })
 
-@login_required
-def cart_add(request,product_id):
-    product = get_object_or_404(models.Product,id=product_id)
-    try:
-        cart = models.Cart.objects.get(user=request.user)
-    except:
-        cart  = models.Cart.objects.create(user=request.user)
-    
-    try:
-        cart_item = models.CartItem.objects.get(cart=cart,product=product)
-        cart_item.quantity +=1
-        cart_item.save()
-    except models.CartItem.DoesNotExist:
-        models.CartItem.objects.create(cart=cart,product=product,quantity=1)
-    
+def _guest_redirect(guest, *args, **kwargs):
+    response = redirect(*args, **kwargs)
+    guest.save(response)
+    return response
+
+async def cart_detail(request):
+    user = await aget_user(request)
+    if not user.is_authenticated:
+        return await _cart_page(request, await GuestCart(request).aitems())
+    cart = await carts.aget_cart(user)
+    return await _cart_page(request, [item async for item in cart.items.select_related('product__category')])
+
+async def cart_add(request,product_id):
+    product = await aget_object_or_404(models.Product.objects.only('id','name','slug'),id=product_id)
+    user = await aget_user(request)
+    if not user.is_authenticated:
+        guest = GuestCart(request)
+        guest.add(product.id)
+        messages.success(request,f'{product.name} has been added to your cart!')
+        return _guest_redirect(guest, 'shop:product_detail', slug=product.slug)
+    await carts.aadd(await carts.aget_cart(user), product.id)
     messages.success(request,f'{product.name} has been added to your cart!')
     return redirect('shop:product_detail',slug=product.slug)
 
 
-@login_required
-def cart_remove(request,product_id):
-    cart = get_object_or_404(models.Cart,user=request.user)
-    product = get_object_or_404(models.Product,id=product_id)
-    cart_item = get_object_or_404(models.CartItem,cart=cart,product=product)
-    cart_item.delete()
+async def cart_remove(request,product_id):
+    product = await aget_object_or_404(models.Product.objects.only('id','name'),id=product_id)
+    user = await aget_user(request)
+    if not user.is_authenticated:
+        guest = GuestCart(request)
+        guest.remove(product.id)
+        messages.success(request, f'{product.name} has been removed from your cart!')
+        return _guest_redirect(guest, 'shop:cart_detail')
+    if not await carts.aremove(await carts.aget_cart(user), product.id):
+        raise Http404('Product is not in the cart')
     messages.success(request, f'{product.name} has been removed from your cart!')
     return redirect('shop:cart_detail')
 
 
-@login_required
-def cart_update(request,product_id):
-    cart = get_object_or_404(models.Cart,user=request.user)
-    product = get_object_or_404(models.Product,id=product_id)
-    cart_item = get_object_or_404(models.CartItem,cart=cart,product=product)
+async def cart_update(request,product_id):
+    product = await aget_object_or_404(models.Product.objects.only('id','name'),id=product_id)
     quantity = int(request.POST.get('quantity', 1))
-
+    user = await aget_user(request)
+    guest = None
+    if user.is_authenticated:
+        if not await carts.aset_quantity(await carts.aget_cart(user), product.id, quantity):
+            raise Http404('Product is not in the cart')
+    else:
+        guest = GuestCart(request)
+        guest.set_quantity(product.id, quantity)
     if quantity <= 0:
-        cart_item.delete()
         messages.success(request,f'{product.name} has been removed from your cart!')
     else:
-        cart_item.quantity = quantity
-        cart_item.save()
         messages.success(request,f'cart updated successfully!')
+    if guest is not None:
+        return _guest_redirect(guest, 'shop:cart_detail')
     return  redirect('shop:cart_detail')
 
 
@@ -145,19 +193,14 @@ def checkout(request):
     if request.method == 'POST':
         form = CheckoutForm(request.POST)
         if form.is_valid():
-            order = form.save(commit=False)
-            order.user = request.user
-            order.save()
-
-            for item in cart.items.all():
-                models.OrderItem.objects.create(
-                    order=order,
-                    product=item.product,
-                    price=item.product.price,
-                    quantity=item.quantity
-                )
-
-            cart.items.all().delete()
+            try:
+                order, _ = place_order(request.user, form.save(commit=False))
+            except EmptyCart:
+                messages.warning(request, 'Your cart is empty!')
+                return redirect('shop:cart_detail')
+            except OutOfStock as e:
+                messages.error(request, f'Not enough stock for: {e}')
+                return redirect('shop:cart_detail')
             request.session['order_id'] = order.id
             return redirect('shop:payment_process')
 
@@ -180,12 +223,12 @@ def checkout(request):
 
 @csrf_exempt
 @login_required
-def payment_process(request):
-    order_id = request.session.get('order_id')
+async def payment_process(request):
+    order_id = await request.session.aget('order_id')
     if not order_id:
         return redirect('shop:home')
-    order = get_object_or_404(models.Order,id=order_id)
-    payment_data = generate_sslcommerz_payment(order,request)
+    order = await aget_object_or_404(models.Order,id=order_id)
+    payment_data = await agenerate_sslcommerz_payment(order,request)
 
     if payment_data['status']=='SUCCESS':
         return redirect(payment_data['GatewayPageURL'])
@@ -197,20 +240,16 @@ def payment_process(request):
 def payment_success(request, order_id):
     order = get_object_or_404(models.Order, id=order_id)
 
-    # ✅ prevent double payment
-    if not order.paid:
-        order.paid = True
-        order.status = 'processing'
-        order.transaction_id = str(order.id)
-        order.save()
-
-        # ✅ stock update
-        for item in order.items.all():
-            product = item.product
-            product.stock = max(product.stock - item.quantity, 0)
-            product.save()
+    # ✅ prevent double payment, only one callback can flip paid
+    if models.Order.objects.filter(id=order.id, paid=False).update(
+        paid=True, status='processing', transaction_id=str(order.id), updated=timezone.now()
+    ):
+        order.refresh_from_db()
+        # ✅ stock was reserved at checkout, make it final
+        commit_stock(order)
 
-        send_order_confirmation_email(order)
+        # ✅ queued, the send_outbox_emails worker renders and sends it
+        enqueue('order_confirmation', order=order)
 
     # ✅ auto login user (very important)
     if not request.user.is_authenticated:
@@ -224,35 +263,72 @@ def payment_success(request, order_id):
 @csrf_exempt
 def payment_fail(request,order_id):
     order = get_object_or_404(models.Order,id=order_id,user=request.user)
-    order.status = 'canceled'
-    order.save()
+    # update() rather than save(), so the stock_status column is left to release_stock
+    models.Order.objects.filter(id=order.id,paid=False).update(status='canceled',updated=timezone.now())
+    release_stock(order)
     return redirect('shop:checkout')
 
 @csrf_exempt
 @login_required
 def payment_cancel(request,order_id):
     order = get_object_or_404(models.Order,id=order_id,user=request.user)
-    order.status = 'canceled'
-    order.save()
+    # update() rather than save(), so the stock_status column is left to release_stock
+    models.Order.objects.filter(id=order.id,paid=False).update(status='canceled',updated=timezone.now())
+    release_stock(order)
     return redirect('shop:cart_detail')
 
 
+@replica_reads
 @login_required
 def profile(request):
     tab = request.GET.get('tab')
-    orders = models.Order.objects.filter(user=request.user).order_by('-created')
-    completed_orders = orders.filter(status='delivered').count()
-    total_spent = sum(order.get_total_cost() for order in orders if order.paid)
+    orders = models.Order.objects.filter(user=request.user)
+    # every profile number in one aggregate over the stored order totals
+    stats = orders.aggregate(
+        total_orders=Count('id'),
+        total_spent=Coalesce(Sum('subtotal', filter=Q(paid=True)), Decimal('0')),
+        **{f'status_{key}': Count('id', filter=Q(status=key)) for key, label in models.Order.STATUS_CHOICES},
+    )
+    status_counts = [
+        (label, stats[f'status_{key}']) for key, label in sorted(models.Order.STATUS_CHOICES) if stats[f'status_{key}']
+    ]
     order_history_active=(tab=='orders')
+    page = None
+    if order_history_active:
+        history = orders.prefetch_related(
+            Prefetch('items', queryset=models.OrderItem.objects.select_related('product__category'))
+        )
+        paginator = KeysetPaginator(history, ('-created', '-id'), per_page=ORDERS_PER_PAGE)
+        try:
+            page = paginator.page(request.GET.get('cursor'))
+        except InvalidCursor:
+            page = paginator.page()
     context={
         'user':request.user,
-        'orders':orders,
+        'orders':page or [],
         'order_history_active' : order_history_active,
-        'completed_orders':completed_orders,
-        'total_spent':total_spent
+        'total_orders':stats['total_orders'],
+        'completed_orders':stats['status_delivered'],
+        'total_spent':stats['total_spent'],
+        'status_counts':status_counts,
+        'next_page_url':cursor_url(request, page.next_cursor) if page else None,
+        'previous_page_url':cursor_url(request, page.previous_cursor) if page else None,
     }
     return render(request,'shop/profile.html',context)
 
+def metrics(request):
+    # Prometheus text format, for staff or the scraper's address in INTERNAL_IPS
+    if not (request.user.is_staff or request.META.get('REMOTE_ADDR') in settings.INTERNAL_IPS):
+        return HttpResponseForbidden()
+    lines = [
+        '# HELP shop_cache_requests_total Catalogue cache lookups by layer and result.',
+        '# TYPE shop_cache_requests_total counter',
+    ]
+    for (layer, result), count in sorted(cache_stats.snapshot().items()):
+        lines.append(f'shop_cache_requests_total{{layer="{layer}",result="{result}"}} {count}')
+    lines += request_metrics.render()
+    return HttpResponse('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4')
+
 @login_required
 def rate_product(request,product_id):
     product = get_object_or_404(models.Product,id=product_id)
@@ -290,7 +366,9 @@ def login_view(request):
         if form.is_valid():  
             user = form.get_user()
             login(request, user)
-            return redirect("shop:home")
+            response = redirect("shop:home")
+            merge_guest_cart(request, user, response)
+            return response
         else:
             messages.error(request, "Invalid username or password")
             return redirect('shop:register')
@@ -323,7 +401,9 @@ def register_view(request):
             user = form.save()
             login(request,user)
             messages.success(request,'Registration Successful!')
-            return redirect('shop:home')
+            response = redirect('shop:home')
+            merge_guest_cart(request, user, response)
+            return response
     else:
         form = RegistrationForm()
     return render(request,'shop/register.html', {'form':form})